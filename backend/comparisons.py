@@ -0,0 +1,104 @@
+"""
+Peer selection for /comparisons/{entity_id}.
+
+Everything here works on integer row positions into the dataset snapshot,
+so a request never copies or filters the DataFrame:
+- random:  n other entities drawn uniformly (their first row each)
+- sector:  n other entities from the same NACE level 1 sector as the
+           entity (their row in that sector each)
+- revenue: the n entities with the closest revenue (one row each)
+"""
+
+import numpy as np
+
+COMPARISON_MODES = ("random", "sector", "revenue")
+
+
+def _draw(rng, candidates, n, excluded):
+    """
+    Draw up to n items from candidates without replacement, skipping any in
+    excluded. Oversampling by len(excluded) keeps this exact without first
+    building a filtered copy of candidates.
+    """
+    size = min(len(candidates), n + len(excluded))
+    picks = candidates[rng.choice(len(candidates), size=size, replace=False)]
+    if excluded:
+        picks = picks[~np.isin(picks, excluded)]
+    return picks[:n]
+
+
+class ComparisonIndex:
+    def __init__(self, df, positions):
+        self.positions = positions
+        # One row per entity, so a response never repeats a peer
+        first_rows = np.array([rows[0] for rows in positions.values()], dtype=np.int64)
+        self.all_rows = first_rows
+
+        # Sector groups over the first row of each (sector, entity) pair
+        sectors = df["nace_level_1_name"]
+        unique_rows = np.flatnonzero(~df.duplicated(["nace_level_1_name", "entity_id"]).to_numpy())
+        unique_sectors = sectors.iloc[unique_rows]
+        self.sector_rows = {
+            sector: unique_rows[rows]
+            for sector, rows in unique_sectors.groupby(unique_sectors, sort=False).indices.items()
+        }
+        self.sector_of = {
+            entity_id: sectors.iat[rows[0]] for entity_id, rows in positions.items()
+        }
+
+        # First row of each entity with a known revenue, sorted by revenue
+        self.revenue = df["revenue"].to_numpy(dtype=float)
+        revenue = self.revenue[first_rows]
+        known = ~np.isnan(revenue)
+        order = np.argsort(revenue[known], kind="stable")
+        self.revenue_rows = first_rows[known][order]
+        self.revenue_sorted = revenue[known][order]
+
+    def sample(self, entity_id, n, mode="random", seed=None):
+        """
+        Row positions of n comparison records for entity_id.
+        Returns None when a similar-peer mode is asked for an unknown entity.
+        """
+        excluded = self.positions.get(entity_id, [])
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        if mode == "random":
+            return _draw(np.random.default_rng(seed), self.all_rows, n, excluded)
+
+        if entity_id not in self.positions:
+            return None
+
+        if mode == "sector":
+            candidates = self.sector_rows.get(self.sector_of[entity_id])
+            if candidates is None:  # entity has no sector
+                return np.empty(0, dtype=np.int64)
+            return _draw(np.random.default_rng(seed), candidates, n, excluded)
+
+        if mode == "revenue":
+            return self._nearest_revenue(excluded, n)
+
+        raise ValueError(f"Unknown comparison mode: {mode}")
+
+    def _nearest_revenue(self, excluded, n):
+        target = self.revenue[excluded[0]]
+        if np.isnan(target):
+            return np.empty(0, dtype=np.int64)
+
+        # Walk outwards from the entity's place in the sorted revenues,
+        # always taking the closer neighbour
+        rank = np.searchsorted(self.revenue_sorted, target)
+        lo, hi = rank - 1, rank
+        picks = []
+        excluded = set(excluded)
+        while len(picks) < n and (lo >= 0 or hi < len(self.revenue_rows)):
+            take_lo = hi >= len(self.revenue_rows) or (
+                lo >= 0 and target - self.revenue_sorted[lo] <= self.revenue_sorted[hi] - target
+            )
+            if take_lo:
+                row, lo = self.revenue_rows[lo], lo - 1
+            else:
+                row, hi = self.revenue_rows[hi], hi + 1
+            if row not in excluded:
+                picks.append(row)
+        return np.asarray(picks, dtype=np.int64)
@@ -0,0 +1,183 @@
+"""
+In-memory dataset snapshot for the API.
+
+All lookup structures are built once when the CSV is loaded, so request
+handlers never scan or copy the DataFrame.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from comparisons import ComparisonIndex
+from data_io import read_table
+
+
+def build_records(frame):
+    """
+    Convert a DataFrame to a list of JSON-ready dicts in one columnar pass.
+    Casting to object boxes numpy scalars as plain Python values, and the
+    mask replaces NaN/NA with None.
+    """
+    clean = frame.astype(object).where(frame.notna(), None)
+    return clean.to_dict(orient="records")
+
+
+def dump_json(payload):
+    """Serialize an already-clean payload to UTF-8 JSON bytes"""
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False).encode("utf-8")
+
+
+def join_json(key, fragments):
+    """Wrap pre-serialized JSON fragments as {"key": [fragment, ...]}"""
+    return b'{"' + key.encode("utf-8") + b'":[' + b",".join(fragments) + b"]}"
+
+
+class DatasetSnapshot:
+    """final_ds.csv plus an entity_id -> row positions index"""
+
+    def __init__(self, df, generation=1):
+        self.df = df
+        # Bumped on every reload; derived caches compare it to drop stale entries
+        self.generation = generation
+        self.entity_ids = df["entity_id"].tolist()
+        self.records = build_records(df)
+        self.record_json = [dump_json(record) for record in self.records]
+        self.entity_ids_json = dump_json({"entity_ids": self.entity_ids})
+
+        # Some entities have several rows (one per sector / activity),
+        # so keep every position, in file order
+        self.positions = {}
+        for pos, entity_id in enumerate(self.entity_ids):
+            self.positions.setdefault(entity_id, []).append(pos)
+
+        self.entity_records = {
+            entity_id: [self.records[pos] for pos in positions]
+            for entity_id, positions in self.positions.items()
+        }
+
+        # Vectorized id -> first row lookup for batch requests
+        self.entity_index = pd.Index(list(self.positions))
+        self.first_rows = np.array([rows[0] for rows in self.positions.values()], dtype=np.int64)
+        self.columns = list(df.columns)
+
+        self.comparisons = ComparisonIndex(df, self.positions)
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_record(self, entity_id):
+        """First record for the entity, or None if it is unknown"""
+        rows = self.entity_records.get(entity_id)
+        return rows[0] if rows else None
+
+    def lookup(self, entity_ids):
+        """First row position for each id in one vectorized pass (-1 if unknown)"""
+        found = self.entity_index.get_indexer(entity_ids)
+        return np.where(found >= 0, self.first_rows[found], -1)
+
+
+def load_dataset(path, generation=1):
+    """Read the CSV (via its memory-mapped Arrow copy when fresh) and build a snapshot"""
+    return DatasetSnapshot(read_table(path), generation=generation)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class DatasetStore:
+    """
+    Holds the current DatasetSnapshot. reload() builds a complete new
+    snapshot (frame, indexes, serialized records) off to the side and then
+    publishes it with a single reference assignment, so readers see either
+    the old snapshot or the new one, never a half-built state. Handlers
+    should read store.current once per request.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._reload_lock = threading.Lock()
+        self._stamp = _file_stamp(path)
+        self.current = load_dataset(path)
+        self.last_error = None
+
+    def reload(self, force=True):
+        """Rebuild and swap in a new snapshot; returns the current snapshot"""
+        with self._reload_lock:
+            try:
+                stamp = _file_stamp(self.path)
+                if not force and stamp == self._stamp:
+                    return self.current
+                snapshot = load_dataset(self.path, generation=self.current.generation + 1)
+            except Exception as e:
+                # Keep serving the previous snapshot
+                self.last_error = str(e)
+                raise
+            self._stamp = stamp
+            self.last_error = None
+            self.current = snapshot
+            print(f"Dataset reloaded: generation {snapshot.generation}, {len(snapshot)} rows")
+            return snapshot
+
+    def watch(self, interval):
+        """Poll the file every interval seconds and reload when it changes"""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload(force=False)
+                except Exception as e:
+                    print(f"Dataset reload failed: {e}")
+
+        threading.Thread(target=run, name="dataset-watcher", daemon=True).start()
+
+
+class CsvPayloadCache:
+    """
+    JSON payload for a CSV file, rebuilt only when the file's mtime or size
+    changes. Each build also gets a content ETag for conditional requests.
+    """
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        # (stamp, payload, etag), replaced as a whole so readers never pair
+        # one build's payload with another build's ETag
+        self._entry = (None, None, None)
+
+    def get(self):
+        """Return (payload_bytes, etag); raises FileNotFoundError if the file is gone"""
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached_stamp, payload, etag = self._entry
+        if stamp == cached_stamp:
+            return payload, etag
+
+        with self._lock:
+            # Another request may have rebuilt it while we waited
+            cached_stamp, payload, etag = self._entry
+            if stamp != cached_stamp:
+                frame = pd.read_csv(self.path)
+                payload = dump_json({self.key: build_records(frame)})
+                etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+                self._entry = (stamp, payload, etag)
+            return payload, etag
+
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match header value against our (strong) ETag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
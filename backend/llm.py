@@ -0,0 +1,210 @@
+"""
+Async access to the Gemini model.
+
+Every LLM call goes through LLMClient, which caps the number of outstanding
+requests with a semaphore, applies a per-call timeout and keeps simple
+queue/latency counters for the /ai/metrics endpoint.
+
+For offline load testing set LLM_FAKE_LATENCY (seconds) to swap Gemini for
+FakeModel, which sleeps instead of calling the API.
+"""
+
+import asyncio
+import time
+
+from prompt_context import estimate_tokens
+
+
+class LLMTimeoutError(Exception):
+    """The model did not answer within the configured timeout"""
+
+
+def extract_text(response):
+    """Pull the text out of a generate_content response"""
+    # Handle different response formats
+    if hasattr(response, 'text'):
+        return response.text
+    elif hasattr(response, 'candidates') and len(response.candidates) > 0:
+        return response.candidates[0].content.parts[0].text
+    return str(response)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel with an injectable latency"""
+
+    def __init__(self, latency=0.5, text="This is a placeholder response from the fake model."):
+        self.latency = latency
+        self.text = text
+
+    def generate_content(self, prompt):
+        time.sleep(self.latency)
+        return FakeResponse(self.text)
+
+    async def _stream(self):
+        # Spread the latency over the words so streaming behaves realistically
+        words = self.text.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield FakeResponse(word if i == 0 else " " + word)
+
+    async def generate_content_async(self, prompt, stream=False):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        return FakeResponse(self.text)
+
+
+def _chunk_text(chunk):
+    # Gemini raises ValueError on .text for chunks without parts (e.g. the final one)
+    try:
+        return extract_text(chunk)
+    except ValueError:
+        return ""
+
+
+class LLMClient:
+    """Bounded-concurrency async wrapper around a generate_content model"""
+
+    def __init__(self, provider, max_concurrency=4, timeout=30.0):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # Metrics
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.total_wait_seconds = 0.0
+        self.total_call_seconds = 0.0
+        self.prompt_tokens_estimate = 0
+        self.streams_completed = 0
+        self.total_ttft_seconds = 0.0
+        self.total_stream_seconds = 0.0
+
+    async def get_model(self):
+        """The provider's model, discovering it in a worker thread on first use"""
+        if self.provider.model is not None:
+            return self.provider.model
+        return await asyncio.to_thread(self.provider.get_model)
+
+    async def _acquire(self, prompt):
+        self.prompt_tokens_estimate += estimate_tokens(prompt)
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.perf_counter()
+        self.total_wait_seconds += started_at - queued_at
+        self.in_flight += 1
+        return started_at
+
+    def _release(self, started_at):
+        self.in_flight -= 1
+        self.total_call_seconds += time.perf_counter() - started_at
+        self._semaphore.release()
+
+    async def _call(self, model, prompt):
+        # Prefer the native async API; fall back to a worker thread so the
+        # event loop is never blocked by the sync client
+        if hasattr(model, "generate_content_async"):
+            return await model.generate_content_async(prompt)
+        return await asyncio.to_thread(model.generate_content, prompt)
+
+    async def _stream_call(self, model, prompt):
+        if hasattr(model, "generate_content_async"):
+            response = await model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                yield chunk
+        else:
+            # No async streaming API: deliver the whole completion as one chunk
+            yield await asyncio.to_thread(model.generate_content, prompt)
+
+    async def generate(self, prompt):
+        """Generate a completion for prompt and return its text"""
+        model = await self.get_model()
+        started_at = await self._acquire(prompt)
+        try:
+            response = await asyncio.wait_for(self._call(model, prompt), timeout=self.timeout)
+            self.completed += 1
+            return extract_text(response)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMTimeoutError(f"LLM call exceeded {self.timeout:.0f}s timeout")
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._release(started_at)
+
+    async def stream(self, prompt, timings=None):
+        """
+        Yield the completion for prompt as text chunks while it is generated.
+        If a dict is passed as timings, ttft_seconds and duration_seconds are
+        written into it. The timeout applies to the whole stream.
+        """
+        if timings is None:
+            timings = {}
+        model = await self.get_model()
+        started_at = await self._acquire(prompt)
+        deadline = started_at + self.timeout
+        chunks = self._stream_call(model, prompt)
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        chunks.__anext__(), timeout=max(deadline - time.perf_counter(), 0)
+                    )
+                except StopAsyncIteration:
+                    break
+                text = _chunk_text(chunk)
+                if not text:
+                    continue
+                if "ttft_seconds" not in timings:
+                    timings["ttft_seconds"] = time.perf_counter() - started_at
+                    self.total_ttft_seconds += timings["ttft_seconds"]
+                yield text
+            timings["duration_seconds"] = time.perf_counter() - started_at
+            self.total_stream_seconds += timings["duration_seconds"]
+            self.completed += 1
+            self.streams_completed += 1
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMTimeoutError(f"LLM stream exceeded {self.timeout:.0f}s timeout")
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            await chunks.aclose()
+            self._release(started_at)
+
+    def stats(self):
+        finished = self.completed + self.failed + self.timed_out
+        streams = self.streams_completed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": self.total_wait_seconds / finished if finished else 0.0,
+            "avg_call_seconds": self.total_call_seconds / finished if finished else 0.0,
+            "prompt_tokens_estimate": self.prompt_tokens_estimate,
+            "streams_completed": streams,
+            "avg_ttft_seconds": self.total_ttft_seconds / streams if streams else 0.0,
+            "avg_stream_seconds": self.total_stream_seconds / streams if streams else 0.0,
+        }
@@ -2,40 +2,42 @@
 # To run use uvicorn main:app --reload
 # or uvicorn main:app --reload --port 8000
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import pandas as pd
-import numpy as np
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
+import asyncio
 import json
-
-# Load environment variables from project root
 import pathlib
+import secrets
+import sys
+import time
+
+# Shared data access / feature code lives next to the pipeline scripts
 project_root = pathlib.Path(__file__).parent.parent
-load_dotenv(dotenv_path=project_root / ".env")
+sys.path.append(str(project_root / "notebooks"))
 
-# Helper function to replace NaN values with None for JSON serialization
-def clean_dict_for_json(data):
-    """Recursively replace NaN values with None in dictionaries"""
-    if isinstance(data, dict):
-        return {k: clean_dict_for_json(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [clean_dict_for_json(item) for item in data]
-    elif pd.isna(data):
-        return None
-    elif isinstance(data, (np.integer, np.floating)):
-        if pd.isna(data):
-            return None
-        return data.item() if hasattr(data, 'item') else data
-    else:
-        return data
+from dataset import CsvPayloadCache, DatasetStore, dump_json, etag_matches, join_json
+from llm import FakeModel, LLMClient, LLMTimeoutError
+from model_provider import GeminiModelProvider, StaticModelProvider
+from predictor import EmissionsPredictor, MicroBatcher
+from prompt_context import PromptContextBuilder, estimate_tokens
+from response_cache import ResponseCache
+
+# Load environment variables from project root
+load_dotenv(dotenv_path=project_root / ".env")
 
 app = FastAPI()
 
+
+def json_bytes_response(content):
+    """Return pre-serialized JSON bytes without re-encoding them"""
+    return Response(content=content, media_type="application/json")
+
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -47,112 +49,291 @@ app.add_middleware(
 
 # Load dataset once at startup
 PATH_TO_CSV = "../data/final_ds.csv" # Adjust path as needed
-df = pd.read_csv(PATH_TO_CSV)
+# Loaded once at startup; POST /admin/reload (or the optional file watcher)
+# swaps in a fresh snapshot without a restart
+store = DatasetStore(PATH_TO_CSV)
 
-# Initialize Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-gemini_model = None
+# Rendered entity blocks for LLM prompts, memoized per entity
+prompts = PromptContextBuilder()
 
-if GEMINI_API_KEY:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        print(f"Gemini API key loaded (key length: {len(GEMINI_API_KEY)})")
-        
-        # List available models to see what's accessible
-        print("Checking available models...")
-        models = genai.list_models()
-        available_models = []
-        for m in models:
-            if 'generateContent' in m.supported_generation_methods:
-                model_name = m.name.split('/')[-1]  # Get just the model name
-                available_models.append(model_name)
-                print(f"  - {model_name}")
-        
-        if not available_models:
-            print("WARNING: No models found with generateContent support!")
-        else:
-            # Try different model names in order of preference
-            # Use models that are actually available from the list (prioritize these!)
-            model_names_to_try = [
-                'gemini-2.5-flash',      # Latest stable flash model (AVAILABLE)
-                'gemini-2.0-flash',      # Alternative flash model (AVAILABLE)
-                'gemini-flash-latest',   # Latest flash alias (AVAILABLE)
-                'gemini-2.5-pro',        # Latest pro model (AVAILABLE)
-                'gemini-pro-latest',     # Latest pro alias (AVAILABLE)
-            ]
-            
-            # Also try any models from the available list that we haven't tried
-            for model_name in available_models:
-                if model_name not in model_names_to_try and 'flash' in model_name.lower():
-                    model_names_to_try.append(model_name)
-            
-            for model_name in model_names_to_try:
-                try:
-                    test_model = genai.GenerativeModel(model_name)
-                    # Actually test the model with a simple request to verify it works
-                    try:
-                        test_response = test_model.generate_content("test")
-                        gemini_model = test_model
-                        print(f"✓ Successfully initialized and tested model: {model_name}")
-                        break
-                    except Exception as test_error:
-                        print(f"✗ Model {model_name} initialized but failed test: {str(test_error)[:100]}")
-                        continue
-                except Exception as e:
-                    print(f"✗ Failed to initialize {model_name}: {str(e)[:100]}")
-                    continue
-            
-            if not gemini_model:
-                print("ERROR: Could not initialize any Gemini model!")
-                print("This might indicate:")
-                print("  1. API key is invalid or expired")
-                print("  2. API key doesn't have access to these models")
-                print("  3. Model names have changed")
-    except Exception as e:
-        print(f"ERROR configuring Gemini API: {str(e)}")
-        print("This might indicate an invalid or expired API key")
+# Gemini model selection is lazy: the provider probes in a background
+# thread after startup (or on first use) and caches its choice on disk
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+LLM_FAKE_LATENCY = os.getenv("LLM_FAKE_LATENCY")
+
+if LLM_FAKE_LATENCY:
+    # Offline load testing: replace Gemini with a fake model that just sleeps
+    model_provider = StaticModelProvider(FakeModel(latency=float(LLM_FAKE_LATENCY)))
+    print(f"Using fake LLM model (latency={float(LLM_FAKE_LATENCY)}s)")
+elif GEMINI_API_KEY:
+    print(f"Gemini API key loaded (key length: {len(GEMINI_API_KEY)})")
+    model_provider = GeminiModelProvider(
+        GEMINI_API_KEY,
+        cache_path=project_root / ".cache" / "gemini_model.json",
+        cache_ttl=float(os.getenv("GEMINI_MODEL_CACHE_TTL_SECONDS", "86400")),
+    )
 else:
     print("Warning: GEMINI_API_KEY not found in environment variables")
+    model_provider = StaticModelProvider(None, reason="GEMINI_API_KEY not set")
+
+# All LLM calls share one bounded pool so slow generations cannot starve
+# the cheap data endpoints
+llm = LLMClient(
+    model_provider,
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+    timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "30")),
+)
+
+# Oldest chat history is dropped when a prompt would exceed this estimate
+LLM_MAX_PROMPT_TOKENS = int(os.getenv("LLM_MAX_PROMPT_TOKENS", "8000"))
+
+# Emissions models written by 02_model_training.py, loaded once at startup.
+# Concurrent /predict requests are scored together in micro-batches.
+MODEL_DIR = pathlib.Path(os.getenv("MODEL_DIR", project_root / "notebooks" / "models"))
+MODEL_VERSION = os.getenv("MODEL_VERSION")  # unset = the registry's latest version
+predictor = None
+predictor_error = None
+predict_batcher = None
+
+def load_predictor():
+    global predictor, predictor_error, predict_batcher
+    started = time.perf_counter()
+    try:
+        predictor = EmissionsPredictor.load(MODEL_DIR, MODEL_VERSION)
+    except (FileNotFoundError, ImportError) as e:
+        predictor_error = str(e)
+        print(f"Warning: emissions models not loaded ({predictor_error}); run 02_model_training.py")
+        return
+    predict_batcher = MicroBatcher(
+        predictor.predict,
+        max_batch_size=int(os.getenv("PREDICT_MAX_BATCH_SIZE", "64")),
+        max_wait=float(os.getenv("PREDICT_MAX_WAIT_MS", "5")) / 1000,
+    )
+    print(f"Emissions models {predictor.version} loaded from {MODEL_DIR} "
+          f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+@app.on_event("startup")
+def start_background_tasks():
+    load_predictor()
+    model_provider.start()
+    watch_interval = float(os.getenv("DATASET_WATCH_INTERVAL_SECONDS", "0"))
+    if watch_interval > 0:
+        store.watch(watch_interval)
 
 @app.get("/")
 def root():
     return {"message": "FastAPI backend is running!"}
 
+@app.get("/health")
+def health():
+    """Readiness of the data endpoints and of the Gemini model"""
+    dataset = store.current
+    return {
+        "status": "ok",
+        "dataset_rows": len(dataset),
+        "dataset_generation": dataset.generation,
+        "dataset_reload_error": store.last_error,  # last failed reload, None once one succeeds
+        "llm": model_provider.health(),
+        "predictor": (
+            {"status": "ready", "model_version": predictor.version} if predictor
+            else {"status": "unavailable", "error": predictor_error}
+        ),
+    }
+
 @app.get("/entity_ids")
 def get_entity_ids():
-    ids = df["entity_id"].tolist()
-    return {"entity_ids": ids}
+    dataset = store.current
+    return json_bytes_response(dataset.entity_ids_json)
+
+# submission.csv only changes when 02_model_training.py reruns, so the parsed
+# payload is cached and rebuilt when the file's mtime/size changes
+submission_cache = CsvPayloadCache(project_root / "notebooks" / "submission.csv", key="data")
 
 @app.get("/submission-data")
-def get_submission_data():
+def get_submission_data(if_none_match: Optional[str] = Header(default=None)):
     """Returns the submission.csv data for scatter plot visualization"""
-    submission_path = project_root / "notebooks" / "submission.csv"
-    if not submission_path.exists():
+    try:
+        payload, etag = submission_cache.get()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Submission data not found")
-    submission_df = pd.read_csv(submission_path)
-    records = submission_df.to_dict(orient="records")
-    return {"data": clean_dict_for_json(records)}
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
 
 @app.get("/company/{entity_id}")
 def get_company(entity_id: int):
     # Returns the first row corresponding to the given entity_id
-    # (some entities may have multiple rows)
-    row = df[df["entity_id"] == entity_id]
-    if row.empty:
+    # (some entities may have multiple rows, see /company/{entity_id}/records)
+    dataset = store.current
+    positions = dataset.positions.get(entity_id)
+    if not positions:
         raise HTTPException(status_code=404, detail="Entity not found")
-    data = row.iloc[0].to_dict()
-    return clean_dict_for_json(data)
+    return json_bytes_response(dataset.record_json[positions[0]])
+
+@app.get("/company/{entity_id}/records")
+def get_company_records(entity_id: int):
+    """Returns every row for the given entity_id, in file order"""
+    dataset = store.current
+    positions = dataset.positions.get(entity_id)
+    if not positions:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    records = b",".join(dataset.record_json[pos] for pos in positions)
+    return json_bytes_response(b'{"entity_id":%d,"records":[%s]}' % (entity_id, records))
+
+class CompanyBatchRequest(BaseModel):
+    entity_ids: List[int] = Field(max_length=1000)
+    fields: Optional[List[str]] = None
+
+
+@app.post("/companies:batch")
+def get_companies_batch(request: CompanyBatchRequest):
+    """
+    Returns the first record of each requested entity, in request order.
+    Unknown ids yield {"entity_id": id, "not_found": true}.
+    Pass fields to receive only those columns (entity_id is always included).
+    """
+    dataset = store.current
+    positions = dataset.lookup(request.entity_ids)
+
+    if request.fields is None:
+        items = [
+            dataset.record_json[pos] if pos >= 0
+            else dump_json({"entity_id": entity_id, "not_found": True})
+            for entity_id, pos in zip(request.entity_ids, positions)
+        ]
+        return json_bytes_response(join_json("companies", items))
+
+    unknown = [field for field in request.fields if field not in dataset.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    fields = ["entity_id"] + [field for field in request.fields if field != "entity_id"]
+    companies = []
+    for entity_id, pos in zip(request.entity_ids, positions):
+        if pos < 0:
+            companies.append({"entity_id": entity_id, "not_found": True})
+        else:
+            record = dataset.records[pos]
+            companies.append({field: record[field] for field in fields})
+    return json_bytes_response(dump_json({"companies": companies}))
+
 
 @app.get("/comparisons/{entity_id}")
-def get_comparisons(entity_id: int, n: int = 5):
+def get_comparisons(
+    entity_id: int,
+    n: int = 5,
+    mode: Literal["random", "sector", "revenue"] = "random",
+    seed: Optional[int] = Query(None, ge=0),  # numpy rejects negative seeds
+):
     """
-    Returns n random records from the dataset excluding the current entity_id.
+    Returns n comparison records excluding the current entity_id.
     Default is 5 comparisons.
+    - mode=random: random records from the whole dataset (default)
+    - mode=sector: random records from the entity's NACE level 1 sector
+    - mode=revenue: the entities with the closest revenue
+    Pass seed to make the random modes deterministic.
     """
-    other_records = df[df["entity_id"] != entity_id]
-    sample = other_records.sample(n=min(n, len(other_records)))  # handle small datasets
-    records = sample.to_dict(orient="records")
-    return {"comparisons": clean_dict_for_json(records)}
+    dataset = store.current
+    picks = dataset.comparisons.sample(entity_id, n, mode=mode, seed=seed)
+    if picks is None:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return json_bytes_response(
+        join_json("comparisons", [dataset.record_json[pos] for pos in picks])
+    )
+
+
+class SectorRevenue(BaseModel):
+    nace_level_1_code: str
+    nace_level_2_code: Optional[int] = None
+    revenue_pct: float
+
+
+class EnvironmentalActivity(BaseModel):
+    env_score_adjustment: float
+    activity_type: Optional[str] = None
+
+
+class SustainableDevelopmentGoal(BaseModel):
+    sdg_id: int
+
+
+class PredictRequest(BaseModel):
+    entity_id: Optional[int] = None
+    region_code: str
+    region_name: Optional[str] = None
+    country_code: str
+    country_name: Optional[str] = None
+    revenue: float
+    overall_score: float
+    environmental_score: float
+    social_score: float
+    governance_score: float
+    sectors: List[SectorRevenue] = []
+    environmental_activities: List[EnvironmentalActivity] = []
+    sdgs: List[SustainableDevelopmentGoal] = []
+
+
+class PredictResponse(BaseModel):
+    entity_id: Optional[int]
+    target_scope_1: float
+    target_scope_2: float
+    model_version: Optional[str] = None
+
+
+@app.post("/predict", response_model=PredictResponse)
+async def predict_emissions(request: PredictRequest):
+    """
+    Estimate Scope 1 and Scope 2 emissions for one company from raw attributes
+    (train.csv columns plus its sector, environmental activity and SDG rows),
+    using the same feature pipeline and ensemble as submission.csv.
+    """
+    if predict_batcher is None:
+        raise HTTPException(status_code=503, detail=f"Emissions models not loaded: {predictor_error}")
+    try:
+        scope_1, scope_2 = await predict_batcher.submit(request.model_dump())
+    except Exception as e:
+        print(f"Error in predict_emissions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error predicting emissions: {str(e)}")
+    return PredictResponse(
+        entity_id=request.entity_id,
+        target_scope_1=scope_1,
+        target_scope_2=scope_2,
+        model_version=predictor.version,
+    )
+
+
+@app.get("/predict/metrics")
+def get_predict_metrics():
+    """Micro-batching counters for /predict"""
+    if predict_batcher is None:
+        raise HTTPException(status_code=503, detail=f"Emissions models not loaded: {predictor_error}")
+    return predict_batcher.stats()
+
+
+@app.get("/ai/metrics")
+def get_ai_metrics():
+    """Queue depth, concurrency and latency counters for LLM calls"""
+    return {**llm.stats(), "recommendation_cache": recommendation_cache.stats()}
+
+
+@app.post("/admin/reload")
+async def reload_dataset(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Rebuild the dataset snapshot from final_ds.csv and swap it in atomically.
+    Requests already running keep the snapshot they started with.
+    Requires ADMIN_TOKEN to be configured and sent as X-Admin-Token.
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    if not secrets.compare_digest((x_admin_token or "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    try:
+        # Parsing and indexing run in a worker thread; the event loop keeps serving
+        snapshot = await asyncio.to_thread(store.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed, previous dataset kept: {str(e)}")
+    return {"generation": snapshot.generation, "rows": len(snapshot)}
 
 
 # Pydantic models for request/response
@@ -171,83 +352,33 @@ class ChatResponse(BaseModel):
     response: str
 
 
+def build_chat_prompt(request: ChatRequest):
+    """Render the full chat prompt (entity context + history + new message)"""
+    history = [(msg.role, msg.content) for msg in request.conversation_history or []]
+    conversation_text = prompts.chat_prompt(
+        store.current, request.entity_id, history, request.message,
+        max_tokens=LLM_MAX_PROMPT_TOKENS,
+    )
+    if conversation_text is None:
+        raise HTTPException(status_code=404, detail="Entity not found")
+    return conversation_text
+
+
 @app.post("/ai/chat", response_model=ChatResponse)
-def chat_with_ai(request: ChatRequest):
+async def chat_with_ai(request: ChatRequest):
     """
     Chat endpoint that uses Gemini to answer questions about a specific entity's emissions data.
     """
-    if not gemini_model:
+    if not await llm.get_model():
         raise HTTPException(status_code=500, detail="Gemini API not configured")
     
-    # Get the entity record
-    entity_row = df[df["entity_id"] == request.entity_id]
-    if entity_row.empty:
-        raise HTTPException(status_code=404, detail="Entity not found")
-    
-    entity_data = entity_row.iloc[0].to_dict()
-    
-    # Helper function to safely format values for context
-    def safe_format(value, default='N/A', format_type='str'):
-        if pd.isna(value) or value is None:
-            return default
-        if format_type == 'float':
-            try:
-                return f"{float(value):,.0f}"
-            except (ValueError, TypeError):
-                return default
-        return str(value)
-    
-    # Format entity data for context
-    context = f"""
-You are an AI sustainability advisor specialized in analyzing corporate emissions data and providing actionable recommendations.
-
-Current Entity Data:
-- Entity ID: {safe_format(entity_data.get('entity_id'))}
-- Region: {safe_format(entity_data.get('region_name'))}
-- Country: {safe_format(entity_data.get('country_name'))}
-- Revenue: ${safe_format(entity_data.get('revenue'), format_type='float')}
-- Overall Score: {safe_format(entity_data.get('overall_score'))}
-- Environmental Score: {safe_format(entity_data.get('environmental_score'))}
-- Social Score: {safe_format(entity_data.get('social_score'))}
-- Governance Score: {safe_format(entity_data.get('governance_score'))}
-- Target Scope 1 Emissions: {safe_format(entity_data.get('target_scope_1'))} tCO₂e
-- Target Scope 2 Emissions: {safe_format(entity_data.get('target_scope_2'))} tCO₂e
-- Industry (NACE Level 1): {safe_format(entity_data.get('nace_level_1_name'))}
-- Industry (NACE Level 2): {safe_format(entity_data.get('nace_level_2_name'))}
-- Activity Type: {safe_format(entity_data.get('activity_type'))}
-- Revenue Percentage: {safe_format(entity_data.get('revenue_pct'))}
-- Environmental Score Adjustment: {safe_format(entity_data.get('env_score_adjustment'))}
-
-Your role is to:
-1. Understand and explain the emissions data for this company
-2. Suggest improvement strategies based on their current performance
-3. Answer questions about sustainability goals and best practices
-4. Provide specific, actionable recommendations
-
-Be concise, professional, and data-driven in your responses.
-"""
-    
-    # Build conversation history
-    conversation_text = context + "\n\n"
-    
-    # Add conversation history if provided
-    if request.conversation_history:
-        for msg in request.conversation_history[-5:]:  # Keep last 5 messages for context
-            conversation_text += f"{msg.role.capitalize()}: {msg.content}\n"
-    
-    # Add current user message
-    conversation_text += f"User: {request.message}\n\nAssistant:"
+    conversation_text = build_chat_prompt(request)
     
     try:
-        response = gemini_model.generate_content(conversation_text)
-        # Handle different response formats
-        if hasattr(response, 'text'):
-            response_text = response.text
-        elif hasattr(response, 'candidates') and len(response.candidates) > 0:
-            response_text = response.candidates[0].content.parts[0].text
-        else:
-            response_text = str(response)
+        response_text = await llm.generate(conversation_text)
         return ChatResponse(response=response_text)
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -255,83 +386,69 @@ Be concise, professional, and data-driven in your responses.
         raise HTTPException(status_code=500, detail=f"Error generating response: {str(e)}")
 
 
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ai/chat/stream")
+async def chat_with_ai_stream(request: ChatRequest):
+    """
+    Streaming variant of /ai/chat using Server-Sent Events:
+    - "token" events carry partial text as soon as Gemini produces it
+    - a final "done" event reports time-to-first-token and total duration
+    - an "error" event is sent if generation fails part-way
+    """
+    if not await llm.get_model():
+        raise HTTPException(status_code=500, detail="Gemini API not configured")
+    
+    conversation_text = build_chat_prompt(request)
+
+    async def events():
+        timings = {"prompt_tokens_estimate": estimate_tokens(conversation_text)}
+        try:
+            async for text in llm.stream(conversation_text, timings=timings):
+                yield sse_event("token", {"text": text})
+            yield sse_event("done", timings)
+        except Exception as e:
+            print(f"Error in chat_with_ai_stream: {str(e)}")
+            yield sse_event("error", {"detail": f"Error generating response: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Generated recommendations are cached in memory and in a SQLite file so
+# they survive restarts
+recommendation_cache = ResponseCache(
+    path=pathlib.Path(os.getenv("RECOMMENDATION_CACHE_PATH", project_root / ".cache" / "recommendations.sqlite3")),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "86400")),
+    max_entries=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "256")),
+)
+
+
 class RecommendationResponse(BaseModel):
     recommendations: List[dict]
 
 
 @app.get("/ai/recommendations/{entity_id}", response_model=RecommendationResponse)
-def get_ai_recommendations(entity_id: int):
+async def get_ai_recommendations(entity_id: int):
     """
     Generate automatic AI recommendations for a specific entity.
     Returns up to 3 recommendations with hardcoded impact values for proof of concept.
     """
-    if not gemini_model:
+    if not await llm.get_model():
         raise HTTPException(status_code=500, detail="Gemini API not configured")
     
-    # Get the entity record
-    entity_row = df[df["entity_id"] == entity_id]
-    if entity_row.empty:
+    context = prompts.recommendation_prompt(store.current, entity_id)
+    if context is None:
         raise HTTPException(status_code=404, detail="Entity not found")
     
-    entity_data = entity_row.iloc[0].to_dict()
-    
-    # Helper function to safely format values for context
-    def safe_format(value, default='N/A', format_type='str'):
-        if pd.isna(value) or value is None:
-            return default
-        if format_type == 'float':
-            try:
-                return f"{float(value):,.0f}"
-            except (ValueError, TypeError):
-                return default
-        return str(value)
-    
-    # Format entity data for context
-    context = f"""
-You are an AI sustainability advisor. Analyze the following company data and provide exactly 3 specific, actionable recommendations to improve their sustainability performance.
-
-Company Data:
-- Entity ID: {safe_format(entity_data.get('entity_id'))}
-- Region: {safe_format(entity_data.get('region_name'))}
-- Country: {safe_format(entity_data.get('country_name'))}
-- Revenue: ${safe_format(entity_data.get('revenue'), format_type='float')}
-- Overall Score: {safe_format(entity_data.get('overall_score'))}
-- Environmental Score: {safe_format(entity_data.get('environmental_score'))}
-- Social Score: {safe_format(entity_data.get('social_score'))}
-- Governance Score: {safe_format(entity_data.get('governance_score'))}
-- Target Scope 1 Emissions: {safe_format(entity_data.get('target_scope_1'))} tCO₂e
-- Target Scope 2 Emissions: {safe_format(entity_data.get('target_scope_2'))} tCO₂e
-- Industry (NACE Level 1): {safe_format(entity_data.get('nace_level_1_name'))}
-- Industry (NACE Level 2): {safe_format(entity_data.get('nace_level_2_name'))}
-- Activity Type: {safe_format(entity_data.get('activity_type'))}
-
-Provide exactly 3 recommendations. For each recommendation, provide:
-1. A clear, concise title (max 10 words)
-2. A detailed description explaining why this recommendation is relevant and what actions to take (2-3 sentences)
-3. A category (choose from: Energy, Operations, Governance, Transport, Supply Chain, Waste Management, or Other)
-
-Format your response as a JSON array with this exact structure:
-[
-  {{
-    "title": "Recommendation title",
-    "description": "Detailed description of the recommendation and why it's relevant",
-    "category": "Category name"
-  }},
-  ...
-]
-
-Return ONLY the JSON array, no additional text.
-"""
-    
-    try:
-        response = gemini_model.generate_content(context)
-        # Handle different response formats
-        if hasattr(response, 'text'):
-            response_text = response.text.strip()
-        elif hasattr(response, 'candidates') and len(response.candidates) > 0:
-            response_text = response.candidates[0].content.parts[0].text.strip()
-        else:
-            response_text = str(response).strip()
+    async def generate_recommendations():
+        response_text = (await llm.generate(context)).strip()
         
         # Clean up the response (remove markdown code blocks if present)
         if response_text.startswith("```json"):
@@ -357,6 +474,14 @@ Return ONLY the JSON array, no additional text.
             rec["impact"] = impact_levels[i] if i < len(impact_levels) else "medium"
             rec["estimatedReduction"] = estimated_reductions[i] if i < len(estimated_reductions) else "-500 tCO₂e/year"
         
+        return recommendations
+
+    try:
+        # The prompt is fully determined by the entity row, so identical
+        # prompts reuse a cached (or in-flight) generation
+        recommendations = await recommendation_cache.get_or_compute(
+            ResponseCache.make_key(context), generate_recommendations
+        )
         return RecommendationResponse(recommendations=recommendations)
     except json.JSONDecodeError as e:
         # Fallback if JSON parsing fails
@@ -383,6 +508,8 @@ Return ONLY the JSON array, no additional text.
                 "estimatedReduction": "-900 tCO₂e/year"
             }
         ])
+    except LLMTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
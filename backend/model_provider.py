@@ -0,0 +1,160 @@
+"""
+Lazy Gemini model selection.
+
+Importing the backend must not touch the network, so choosing a working
+model happens in a background thread (start()) or on first use
+(get_model()), whichever comes first. The chosen model name is cached in a
+small JSON file so restarts and --reload skip the probing while the entry
+is fresh.
+"""
+
+import json
+import threading
+import time
+
+# Models to try in order of preference
+MODEL_PREFERENCE = [
+    'gemini-2.5-flash',      # Latest stable flash model
+    'gemini-2.0-flash',      # Alternative flash model
+    'gemini-flash-latest',   # Latest flash alias
+    'gemini-2.5-pro',        # Latest pro model
+    'gemini-pro-latest',     # Latest pro alias
+]
+
+
+class StaticModelProvider:
+    """Provider for a model that is known up front (fake model, or none at all)"""
+
+    def __init__(self, model, reason=None):
+        self.model = model
+        self.reason = reason
+
+    def start(self):
+        pass
+
+    def get_model(self):
+        return self.model
+
+    def health(self):
+        if self.model is None:
+            return {"status": "disabled", "model": None, "detail": self.reason}
+        return {"status": "ready", "model": type(self.model).__name__, "source": "static"}
+
+
+class GeminiModelProvider:
+    """Thread-safe, lazily initialized Gemini model"""
+
+    def __init__(self, api_key, cache_path, cache_ttl=86400, retry_after=60):
+        self.api_key = api_key
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.retry_after = retry_after
+
+        self.model = None
+        self.model_name = None
+        self.status = "pending"  # pending -> probing -> ready | failed
+        self.source = None
+        self.error = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Kick off discovery in the background without blocking startup"""
+        threading.Thread(target=self.get_model, name="gemini-discovery", daemon=True).start()
+
+    def get_model(self):
+        """Return the selected model, running discovery if needed (blocking)"""
+        if self.model is not None:
+            return self.model
+        with self._lock:
+            if self.model is not None:
+                return self.model
+            if self.status == "failed" and time.time() - self._failed_at < self.retry_after:
+                return None
+            self.status = "probing"
+            try:
+                self._discover()
+            except Exception as e:
+                self.error = str(e)
+            if self.model is None:
+                self.status = "failed"
+                self._failed_at = time.time()
+            else:
+                self.status = "ready"
+                self.error = None
+            return self.model
+
+    def health(self):
+        return {
+            "status": self.status,
+            "model": self.model_name,
+            "source": self.source,
+            "detail": self.error,
+        }
+
+    def _read_cache(self):
+        try:
+            cached = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get("selected_at", 0) > self.cache_ttl:
+            return None
+        return cached.get("model")
+
+    def _write_cache(self, model_name):
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            self.cache_path.write_text(json.dumps({"model": model_name, "selected_at": time.time()}))
+        except OSError as e:
+            print(f"Could not cache Gemini model choice: {e}")
+
+    def _discover(self):
+        import google.generativeai as genai
+
+        genai.configure(api_key=self.api_key)
+
+        cached_name = self._read_cache()
+        if cached_name:
+            self.model = genai.GenerativeModel(cached_name)
+            self.model_name = cached_name
+            self.source = "cache"
+            print(f"✓ Using cached Gemini model: {cached_name}")
+            return
+
+        # List available models to see what's accessible
+        print("Checking available models...")
+        available_models = []
+        for m in genai.list_models():
+            if 'generateContent' in m.supported_generation_methods:
+                model_name = m.name.split('/')[-1]  # Get just the model name
+                available_models.append(model_name)
+                print(f"  - {model_name}")
+
+        if not available_models:
+            self.error = "No models found with generateContent support"
+            print(f"WARNING: {self.error}!")
+            return
+
+        # Also try any flash models from the available list that we haven't tried
+        model_names_to_try = list(MODEL_PREFERENCE)
+        for model_name in available_models:
+            if model_name not in model_names_to_try and 'flash' in model_name.lower():
+                model_names_to_try.append(model_name)
+
+        for model_name in model_names_to_try:
+            try:
+                test_model = genai.GenerativeModel(model_name)
+                # Actually test the model with a simple request to verify it works
+                test_model.generate_content("test")
+            except Exception as e:
+                print(f"✗ Model {model_name} failed test: {str(e)[:100]}")
+                continue
+            self.model = test_model
+            self.model_name = model_name
+            self.source = "probe"
+            self._write_cache(model_name)
+            print(f"✓ Successfully initialized and tested model: {model_name}")
+            return
+
+        self.error = "Could not initialize any Gemini model (invalid key, no access, or renamed models)"
+        print(f"ERROR: {self.error}")
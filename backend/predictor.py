@@ -0,0 +1,132 @@
+"""
+Online Scope 1 / Scope 2 scoring for POST /predict.
+
+EmissionsPredictor wraps one model registry version written by
+02_model_training.py (the fitted FeaturePipeline and the
+XGBoost/LightGBM/CatBoost ensemble), loaded once at startup. Scoring goes
+through MicroBatcher, which collects requests arriving within a few
+milliseconds of each other and scores them with a single feature transform
+and one predict call per model.
+"""
+
+import asyncio
+import time
+
+import pandas as pd
+
+from ensemble import ENSEMBLE_WEIGHTS, ensemble_predict
+from model_registry import ModelRegistry
+
+COMPANY_COLUMNS = [
+    "entity_id", "region_code", "region_name", "country_code", "country_name",
+    "revenue", "overall_score", "environmental_score", "social_score", "governance_score",
+]
+
+
+class EmissionsPredictor:
+    def __init__(self, pipeline, models, version=None, manifest=None):
+        self.pipeline = pipeline
+        self.models = models
+        self.version = version
+        self.manifest = manifest or {}
+
+    @classmethod
+    def load(cls, model_dir, version=None):
+        """Load a registry version (the latest one by default)"""
+        artifact = ModelRegistry(model_dir).load(version)
+        return cls(artifact.pipeline, artifact.models, artifact.version, artifact.manifest)
+
+    def build_frames(self, companies):
+        """
+        Raw input frames for a list of company dicts (train.csv columns plus
+        "sectors", "environmental_activities" and "sdgs" row lists).
+        Rows are keyed by position so repeated entity_ids in a batch stay apart.
+        """
+        rows, sectors, env, sdg = [], [], [], []
+        for key, company in enumerate(companies):
+            rows.append({**{col: company.get(col) for col in COMPANY_COLUMNS}, "entity_id": key})
+            sectors.extend({**row, "entity_id": key} for row in company.get("sectors", []))
+            env.extend({**row, "entity_id": key} for row in company.get("environmental_activities", []))
+            sdg.extend({**row, "entity_id": key} for row in company.get("sdgs", []))
+        return {
+            "companies": pd.DataFrame(rows, columns=COMPANY_COLUMNS),
+            "sectors": pd.DataFrame(sectors, columns=["entity_id", "nace_level_1_code", "nace_level_2_code", "revenue_pct"]),
+            "env": pd.DataFrame(env, columns=["entity_id", "env_score_adjustment"]),
+            "sdg": pd.DataFrame(sdg, columns=["entity_id", "sdg_id"]),
+        }
+
+    def predict(self, companies):
+        """[(scope_1, scope_2), ...] for a list of company dicts"""
+        X = self.pipeline.model_input(self.build_frames(companies))
+        weights = self.manifest.get("weights", ENSEMBLE_WEIGHTS)
+        scope_1 = ensemble_predict(self.models["s1"], X, weights)
+        scope_2 = ensemble_predict(self.models["s2"], X, weights)
+        return [(float(s1), float(s2)) for s1, s2 in zip(scope_1, scope_2)]
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent submit() calls into batched calls of predict_batch.
+    A batch is flushed when it reaches max_batch_size or max_wait seconds
+    after its first item arrived; predict_batch runs in a worker thread.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait=0.005):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = []  # (item, future)
+        self._timer = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self.total_batch_seconds = 0.0
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        started = time.perf_counter()
+        try:
+            results = await asyncio.to_thread(self.predict_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            self.total_batch_seconds += time.perf_counter() - started
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "largest_batch": self.largest_batch,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_batch_seconds": self.total_batch_seconds / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,158 @@
+"""
+Prompt rendering shared by /ai/chat and /ai/recommendations.
+
+The entity part of each prompt only depends on the entity's row, so it is
+rendered once per entity and memoized. The memo belongs to one dataset
+generation and is dropped as soon as a newer snapshot is passed in.
+Handlers only append conversation turns.
+"""
+
+CHAT_PREAMBLE = """
+You are an AI sustainability advisor specialized in analyzing corporate emissions data and providing actionable recommendations.
+
+Current Entity Data:
+"""
+
+CHAT_INSTRUCTIONS = """
+Your role is to:
+1. Understand and explain the emissions data for this company
+2. Suggest improvement strategies based on their current performance
+3. Answer questions about sustainability goals and best practices
+4. Provide specific, actionable recommendations
+
+Be concise, professional, and data-driven in your responses.
+"""
+
+RECOMMENDATION_PREAMBLE = """
+You are an AI sustainability advisor. Analyze the following company data and provide exactly 3 specific, actionable recommendations to improve their sustainability performance.
+
+Company Data:
+"""
+
+RECOMMENDATION_INSTRUCTIONS = """
+Provide exactly 3 recommendations. For each recommendation, provide:
+1. A clear, concise title (max 10 words)
+2. A detailed description explaining why this recommendation is relevant and what actions to take (2-3 sentences)
+3. A category (choose from: Energy, Operations, Governance, Transport, Supply Chain, Waste Management, or Other)
+
+Format your response as a JSON array with this exact structure:
+[
+  {
+    "title": "Recommendation title",
+    "description": "Detailed description of the recommendation and why it's relevant",
+    "category": "Category name"
+  },
+  ...
+]
+
+Return ONLY the JSON array, no additional text.
+"""
+
+# (label, column, format, unit)
+COMPANY_FIELDS = [
+    ("Entity ID", "entity_id", "str", ""),
+    ("Region", "region_name", "str", ""),
+    ("Country", "country_name", "str", ""),
+    ("Revenue", "revenue", "money", ""),
+    ("Overall Score", "overall_score", "str", ""),
+    ("Environmental Score", "environmental_score", "str", ""),
+    ("Social Score", "social_score", "str", ""),
+    ("Governance Score", "governance_score", "str", ""),
+    ("Target Scope 1 Emissions", "target_scope_1", "str", " tCO₂e"),
+    ("Target Scope 2 Emissions", "target_scope_2", "str", " tCO₂e"),
+    ("Industry (NACE Level 1)", "nace_level_1_name", "str", ""),
+    ("Industry (NACE Level 2)", "nace_level_2_name", "str", ""),
+    ("Activity Type", "activity_type", "str", ""),
+]
+
+CHAT_FIELDS = COMPANY_FIELDS + [
+    ("Revenue Percentage", "revenue_pct", "str", ""),
+    ("Environmental Score Adjustment", "env_score_adjustment", "str", ""),
+]
+
+# Number of previous chat messages sent along with a new message
+CHAT_HISTORY_LIMIT = 5
+
+
+def estimate_tokens(text):
+    """Rough token count for sizing requests (~4 characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def format_value(value, format_type='str', default='N/A'):
+    """Format a (JSON-clean) record value for a prompt"""
+    if value is None:
+        return default
+    if format_type == 'money':
+        try:
+            return f"${float(value):,.0f}"
+        except (ValueError, TypeError):
+            return f"${default}"
+    return str(value)
+
+
+def render_facts(record, fields):
+    return "".join(
+        f"- {label}: {format_value(record.get(column), format_type)}{unit}\n"
+        for label, column, format_type, unit in fields
+    )
+
+
+class PromptContextBuilder:
+    def __init__(self):
+        self.generation = None
+        self._chat_contexts = {}
+        self._recommendation_prompts = {}
+
+    def _memo(self, dataset):
+        """(chat contexts, recommendation prompts) memo for dataset's generation"""
+        if self.generation is None or dataset.generation > self.generation:
+            self.generation = dataset.generation
+            self._chat_contexts = {}
+            self._recommendation_prompts = {}
+        if dataset.generation == self.generation:
+            return self._chat_contexts, self._recommendation_prompts
+        # A request still holding an older snapshot: render without memoizing
+        return {}, {}
+
+    def chat_context(self, dataset, entity_id):
+        """Entity block for chat prompts, or None if the entity is unknown"""
+        chat_contexts, _ = self._memo(dataset)
+        context = chat_contexts.get(entity_id)
+        if context is None:
+            record = dataset.get_record(entity_id)
+            if record is None:
+                return None
+            context = CHAT_PREAMBLE + render_facts(record, CHAT_FIELDS) + CHAT_INSTRUCTIONS
+            chat_contexts[entity_id] = context
+        return context
+
+    def recommendation_prompt(self, dataset, entity_id):
+        """Complete recommendations prompt, or None if the entity is unknown"""
+        _, recommendation_prompts = self._memo(dataset)
+        prompt = recommendation_prompts.get(entity_id)
+        if prompt is None:
+            record = dataset.get_record(entity_id)
+            if record is None:
+                return None
+            prompt = RECOMMENDATION_PREAMBLE + render_facts(record, COMPANY_FIELDS) + RECOMMENDATION_INSTRUCTIONS
+            recommendation_prompts[entity_id] = prompt
+        return prompt
+
+    def chat_prompt(self, dataset, entity_id, history, message, max_tokens=None):
+        """
+        Entity context + the last CHAT_HISTORY_LIMIT messages + the new message.
+        history is a list of (role, content) pairs. With max_tokens set, the
+        oldest history messages are dropped until the estimate fits.
+        """
+        context = self.chat_context(dataset, entity_id)
+        if context is None:
+            return None
+
+        turns = [f"{role.capitalize()}: {content}\n" for role, content in history[-CHAT_HISTORY_LIMIT:]]
+        tail = f"User: {message}\n\nAssistant:"
+        if max_tokens is not None:
+            budget = max_tokens - estimate_tokens(context + "\n\n" + tail)
+            while turns and sum(estimate_tokens(turn) for turn in turns) > budget:
+                turns.pop(0)
+        return context + "\n\n" + "".join(turns) + tail
@@ -0,0 +1,174 @@
+"""
+Two-tier cache for LLM results keyed by a hash of the rendered prompt.
+
+- Memory tier: small LRU of recently used entries
+- Disk tier: SQLite file that survives restarts
+- Entries expire after a TTL in both tiers; expired disk rows are purged
+  on insert, at most once per purge_interval
+- Concurrent misses for the same key share a single upstream call
+- get_or_compute() runs the SQLite reads and writes in a worker thread, so
+  a disk lookup never blocks the event loop
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, path=None, ttl=86400, max_entries=256, purge_interval=3600):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._pending = {}  # key -> asyncio.Future for in-progress computations
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.shared = 0
+
+        self._db = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self.purge_expired()
+
+    @staticmethod
+    def make_key(prompt):
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+        return None
+
+    def _get_disk(self, key, now):
+        """SQLite lookup (blocking; get_or_compute runs it in a worker thread)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.disk_hits += 1
+                return value
+        return None
+
+    def _put_disk(self, key, value, expires_at):
+        """SQLite insert, plus a purge of expired rows when one is due (blocking)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            if now >= self._next_purge:
+                self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                self._next_purge = now + self.purge_interval
+            self._db.commit()
+
+    def get(self, key):
+        """Cached value for key, or None if missing/expired"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = self._get_disk(key, now)
+        return value
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+        if self._db is not None:
+            self._put_disk(key, value, expires_at)
+
+    def purge_expired(self):
+        """Drop expired entries from both tiers"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                self._db.commit()
+                self._next_purge = now + self.purge_interval
+
+    async def get_or_compute(self, key, compute):
+        """
+        Return the cached value for key, or await compute() and cache its result.
+        If compute() raises, nothing is cached and every waiter sees the error.
+        """
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key, now)
+        if value is not None:
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.shared += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        else:
+            expires_at = time.time() + self.ttl
+            with self._lock:
+                self._remember(key, expires_at, value)
+            future.set_result(value)
+            if self._db is not None:
+                # Waiters already have the value; persist it off the event loop
+                try:
+                    await asyncio.to_thread(self._put_disk, key, value, expires_at)
+                except sqlite3.Error as e:
+                    print(f"Could not persist cached response: {e}")
+            return value
+        finally:
+            del self._pending[key]
+
+    def stats(self):
+        return {
+            "memory_entries": len(self._memory),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "ttl_seconds": self.ttl,
+        }
@@ -95,7 +95,8 @@ export function AISuggestions() {
     }));
 
     try {
-      const response = await fetch("http://localhost:8000/ai/chat", {
+      // Stream the answer token by token (Server-Sent Events)
+      const response = await fetch("http://localhost:8000/ai/chat/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -107,17 +108,53 @@ export function AISuggestions() {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error("Failed to get response");
       }
 
-      const data = await response.json();
-      const assistantMessage: ChatMessage = {
-        role: "assistant",
-        content: data.response,
-        timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+      // Add the assistant message on the first token, then grow it in place
+      let started = false;
+      const appendToken = (text: string) => {
+        if (!started) {
+          started = true;
+          const assistantMessage: ChatMessage = {
+            role: "assistant",
+            content: text,
+            timestamp: new Date().toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' })
+          };
+          setChatMessages((prev) => [...prev, assistantMessage]);
+          return;
+        }
+        setChatMessages((prev) => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+        });
       };
-      setChatMessages((prev) => [...prev, assistantMessage]);
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const rawEvent of events) {
+          const lines = rawEvent.split("\n");
+          const event = lines.find((line) => line.startsWith("event: "))?.slice(7);
+          const data = JSON.parse(lines.find((line) => line.startsWith("data: "))?.slice(6) || "{}");
+          if (event === "token") {
+            appendToken(data.text);
+          } else if (event === "error") {
+            throw new Error(data.detail);
+          }
+        }
+      }
+
+      if (!started) {
+        throw new Error("Empty response");
+      }
     } catch (error) {
       console.error("Error sending message:", error);
       const errorMessage: ChatMessage = {
@@ -264,7 +301,7 @@ export function AISuggestions() {
                 </div>
               </div>
             ))}
-            {loadingChat && (
+            {loadingChat && chatMessages[chatMessages.length - 1]?.role === "user" && (
               <div className="flex justify-start">
                 <div className="bg-slate-100 text-slate-900 rounded-lg rounded-tl-sm px-4 py-3">
                   <div className="flex items-center gap-2">
@@ -7,14 +7,20 @@ ENSEMBLE MODEL TRAINING - TARGET RMSE: ~60k
 - Weighted averaging of predictions
 """
 
+import json
+import os
+import time
 import pandas as pd
 import numpy as np
-import xgboost as xgb
-import lightgbm as lgb
-from catboost import CatBoostRegressor
 from sklearn.model_selection import KFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import warnings
+from cv_executor import CVExecutor, Job
+from data_io import load_frame, load_matrix, read_table
+from ensemble import DEFAULT_PARAMS, ENSEMBLE_WEIGHTS, FoldAverage, ensemble_predict
+from feature_pipeline import FeaturePipeline
+from model_registry import ModelRegistry, data_hash, library_versions
+from oof_cache import OOF_FILE, fold_ids, oof_key, save_oof
 warnings.filterwarnings('ignore')
 
 print("="*70)
@@ -25,15 +31,19 @@ print("="*70)
 # 1. Load Engineered Features
 # ============================================================================
 print("\n[1/6] Loading engineered features...")
-X_train = pd.read_csv('X_train.csv')
-X_test = pd.read_csv('X_test.csv')
-y_scope1 = pd.read_csv('y_scope1.csv').values.ravel()
-y_scope2 = pd.read_csv('y_scope2.csv').values.ravel()
-test_ids = pd.read_csv('test_ids.csv').values.ravel()
+# Dense frames, or CSR matrices when 01 ran with SPARSE_FEATURES / NACE_LEVEL_2
+pipeline = FeaturePipeline.load('feature_pipeline.json')
+load_features = load_matrix if pipeline.is_sparse else load_frame
+X_train = load_features('X_train')
+X_test = load_features('X_test')
+feature_names = pipeline.input_names
+y_scope1 = load_frame('y_scope1').values.ravel()
+y_scope2 = load_frame('y_scope2').values.ravel()
+test_ids = load_frame('test_ids').values.ravel()
 
 print(f"   Features: {X_train.shape[1]}")
-print(f"   Training samples: {len(X_train)}")
-print(f"   Test samples: {len(X_test)}")
+print(f"   Training samples: {X_train.shape[0]}")
+print(f"   Test samples: {X_test.shape[0]}")
 
 # ----------------------------------------------------------------------------
 # 1b. Define a ULTRA-COMPACT core feature set for XGBoost-only comparison
@@ -63,61 +73,37 @@ core_features = [
     'log_revenue_x_environmental_score',
 ]
 
-core_features = [f for f in core_features if f in X_train.columns]
+core_features = [f for f in core_features if f in feature_names]
 print("   Using ULTRA-COMPACT feature set:")
 for f in core_features:
     print("    -", f)
 
-X_train_core = X_train[core_features].copy()
-X_test_core = X_test[core_features].copy()
+# Column labels for a frame, positions for a sparse matrix
+core_columns = [feature_names.index(f) for f in core_features] if pipeline.is_sparse else core_features
 
 # ============================================================================
 # 2. Define Ensemble Models with Heavy Regularization
 # ============================================================================
 print("\n[2/6] Configuring ensemble models...")
 
-# XGBoost with heavy regularization
-xgb_params = {
-    'n_estimators': 500,
-    'max_depth': 4,  # Shallow trees
-    'learning_rate': 0.03,  # Slow learning
-    'subsample': 0.7,
-    'colsample_bytree': 0.7,
-    'min_child_weight': 10,  # Heavy regularization
-    'reg_alpha': 1.0,  # L1 regularization
-    'reg_lambda': 2.0,  # L2 regularization
-    'random_state': 42,
-    'n_jobs': -1
-}
-
-# LightGBM with different regularization
-lgb_params = {
-    'n_estimators': 500,
-    'max_depth': 5,
-    'learning_rate': 0.03,
-    'subsample': 0.7,
-    'colsample_bytree': 0.7,
-    'min_child_samples': 20,
-    'reg_alpha': 0.5,
-    'reg_lambda': 1.5,
-    'random_state': 42,
-    'n_jobs': -1,
-    'verbose': -1
-}
-
-# CatBoost with L2 leaf regularization
-cat_params = {
-    'iterations': 500,
-    'depth': 5,
-    'learning_rate': 0.03,
-    'l2_leaf_reg': 3.0,  # Heavy L2 regularization
-    'random_seed': 42,
-    'verbose': False
-}
-
-print("   ✅ XGBoost configured (max_depth=4, heavy reg)")
-print("   ✅ LightGBM configured (max_depth=5, medium reg)")
-print("   ✅ CatBoost configured (L2 reg=3.0)")
+# Defaults (heavy regularization) are defined in ensemble.DEFAULT_PARAMS.
+# PARAMS_FILE=best_config.json (written by 05_hyperparameter_search.py)
+# replaces them and the ensemble weights with the best searched configuration.
+PARAMS_FILE = os.getenv('PARAMS_FILE')
+params_source = {'params': DEFAULT_PARAMS, 'weights': ENSEMBLE_WEIGHTS}
+if PARAMS_FILE:
+    with open(PARAMS_FILE) as f:
+        params_source = json.load(f)
+    print(f"   Using searched configuration from {PARAMS_FILE}")
+
+xgb_params = dict(params_source['params']['xgb'])
+lgb_params = dict(params_source['params']['lgb'])
+cat_params = dict(params_source['params']['cat'])
+ensemble_weights = dict(params_source['weights'])
+
+print(f"   ✅ XGBoost configured (max_depth={xgb_params['max_depth']}, reg_lambda={xgb_params['reg_lambda']})")
+print(f"   ✅ LightGBM configured (max_depth={lgb_params['max_depth']}, reg_lambda={lgb_params['reg_lambda']})")
+print(f"   ✅ CatBoost configured (L2 reg={cat_params['l2_leaf_reg']})")
 
 # ----------------------------------------------------------------------------
 # 2b. XGBoost-only configuration for core features with lighter regularization
@@ -140,142 +126,155 @@ xgb_core_params = {
 }
 
 # ============================================================================
-# 3. Train Ensemble for Scope 1
+# 3. Train Ensembles (fold x model x target jobs in parallel)
 # ============================================================================
-print("\n[3/6] Training Scope 1 ensemble...")
+print("\n[3/6] Training Scope 1 / Scope 2 ensembles and CV folds...")
 
 # CRITICAL: Log transform targets
 y_scope1_log = np.log1p(y_scope1)
+y_scope2_log = np.log1p(y_scope2)
 
-# Train XGBoost
-print("   Training XGBoost...")
-xgb_s1 = xgb.XGBRegressor(**xgb_params)
-xgb_s1.fit(X_train, y_scope1_log)
-
-# Train LightGBM
-print("   Training LightGBM...")
-lgb_s1 = lgb.LGBMRegressor(**lgb_params)
-lgb_s1.fit(X_train, y_scope1_log)
-
-# Train CatBoost
-print("   Training CatBoost...")
-cat_s1 = CatBoostRegressor(**cat_params)
-cat_s1.fit(X_train, y_scope1_log)
-
-# Cross-validation to evaluate
-kf = KFold(n_splits=5, shuffle=True, random_state=42)
-rmse_scores = []
-rmse_scores_log = []
-
-for train_idx, val_idx in kf.split(X_train):
-    X_tr, X_val = X_train.iloc[train_idx], X_train.iloc[val_idx]
-    y_tr, y_val = y_scope1[train_idx], y_scope1[val_idx]
-    y_tr_log = np.log1p(y_tr)
-    y_val_log = np.log1p(y_val)
-
-    # Train models
-    xgb_temp = xgb.XGBRegressor(**xgb_params)
-    xgb_temp.fit(X_tr, y_tr_log)
+model_params = {'xgb': xgb_params, 'lgb': lgb_params, 'cat': cat_params}
+N_SPLITS, CV_SEED = 5, 42
+
+# Final ensemble:
+#   refit - retrain each model on all training rows (default)
+#   folds - reuse the CV fold models and average their test predictions
+#           (no extra fits, and averaging over folds reduces variance)
+FINAL_MODELS = os.getenv('FINAL_MODELS', 'refit')
+if FINAL_MODELS not in ('refit', 'folds'):
+    raise ValueError(f"FINAL_MODELS must be 'refit' or 'folds', got {FINAL_MODELS!r}")
+print(f"   Final models: {FINAL_MODELS}")
+
+# Early stopping (rounds without validation improvement, 0 = off) and a
+# wall-clock budget per fit (seconds, unset = none)
+EARLY_STOPPING_ROUNDS = int(os.getenv('EARLY_STOPPING_ROUNDS', '0'))
+MODEL_TIME_BUDGET = float(os.getenv('MODEL_TIME_BUDGET_SECONDS', '0')) or None
+training_settings = {'early_stopping_rounds': EARLY_STOPPING_ROUNDS, 'time_budget': MODEL_TIME_BUDGET}
+if EARLY_STOPPING_ROUNDS:
+    print(f"   Early stopping after {EARLY_STOPPING_ROUNDS} rounds without improvement")
+if MODEL_TIME_BUDGET:
+    print(f"   Time budget: {MODEL_TIME_BUDGET:.0f}s per fit")
+kf = KFold(n_splits=N_SPLITS, shuffle=True, random_state=CV_SEED)
+folds = list(kf.split(X_train))
+
+# Leakage-free CV (default): the target-dependent features (country
+# encodings, sector target means) are refit on each fold's training rows,
+# the other columns of X_train are shared by all folds. Final models and
+# test predictions use the full-data pipeline. FOLD_FEATURES=0 scores the
+# folds on the full-data features instead (optimistic CV).
+FOLD_FEATURES = os.getenv('FOLD_FEATURES', '1') != '0'
+fold_frames = None
+if FOLD_FEATURES:
+    train_frames = {'companies': read_table("../data/train.csv")}  # fold features only need the company rows
+    fold_frames = pipeline.fold_features(train_frames, X_train, folds)
+    print("   Fold-aware features: target encodings refit on each fold's training rows")
+
+jobs = []
+for scope in ['s1', 's2']:
+    for family, params in model_params.items():
+        if FINAL_MODELS == 'refit':
+            # Final model on all training rows
+            jobs.append(Job((scope, family, 'full'), family, params, scope,
+                            columns=None, train_idx=None, val_idx=None, keep_model=True))
+        # Cross-validation to evaluate (fold models kept when they are the final ensemble)
+        for fold, (train_idx, val_idx) in enumerate(folds):
+            jobs.append(Job((scope, family, fold), family, params, scope,
+                            columns=None, train_idx=train_idx, val_idx=val_idx,
+                            keep_model=FINAL_MODELS == 'folds', frame=fold if FOLD_FEATURES else None))
+    # XGBoost-only (core features) comparison, same folds (no target-dependent columns)
+    for fold, (train_idx, val_idx) in enumerate(folds):
+        jobs.append(Job((scope, 'xgb_core', fold), 'xgb', xgb_core_params, scope,
+                        columns=core_columns, train_idx=train_idx, val_idx=val_idx, keep_model=False))
+
+executor = CVExecutor(**training_settings)
+print(f"   {len(jobs)} fits on {executor.n_workers} worker(s) x {executor.n_threads} thread(s)")
+train_start = time.perf_counter()
+results = executor.run(jobs, X_train, {'s1': y_scope1_log, 's2': y_scope2_log}, frames=fold_frames)
+train_seconds = time.perf_counter() - train_start
+print(f"   ✅ Wall-clock: {train_seconds:.1f}s (sum of fit times: {sum(r.seconds for r in results.values()):.1f}s)")
+
+if FINAL_MODELS == 'folds':
+    ensemble_models = {
+        scope: {family: FoldAverage(results[(scope, family, fold)].model for fold in range(N_SPLITS))
+                for family in model_params}
+        for scope in ['s1', 's2']
+    }
+else:
+    ensemble_models = {
+        scope: {family: results[(scope, family, 'full')].model for family in model_params}
+        for scope in ['s1', 's2']
+    }
+
+# Timing delta between the two modes: full-data fits are what 'folds' skips
+# (in 'folds' mode estimated from the fold fits, which see 1 - 1/N_SPLITS of the rows)
+cv_fit_seconds = sum(results[(scope, family, fold)].seconds
+                     for scope in ['s1', 's2'] for family in model_params for fold in range(N_SPLITS))
+if FINAL_MODELS == 'refit':
+    full_fit_seconds = sum(results[(scope, family, 'full')].seconds
+                           for scope in ['s1', 's2'] for family in model_params)
+    print(f"   Full-data refits: {full_fit_seconds:.1f}s of fit time (FINAL_MODELS=folds would skip them)")
+else:
+    full_fit_seconds = cv_fit_seconds / N_SPLITS / (1 - 1 / N_SPLITS)
+    print(f"   Skipped full-data refits: ~{full_fit_seconds:.1f}s of fit time saved (estimated)")
+
+# Boosting rounds kept by each final model (per fold for fold ensembles)
+best_iterations = {
+    scope: {
+        family: ([results[(scope, family, fold)].best_iteration for fold in range(N_SPLITS)]
+                 if FINAL_MODELS == 'folds' else results[(scope, family, 'full')].best_iteration)
+        for family in model_params
+    }
+    for scope in ['s1', 's2']
+}
+budget_hits = sum(result.budget_hit for result in results.values())
+if EARLY_STOPPING_ROUNDS or MODEL_TIME_BUDGET:
+    for scope in ['s1', 's2']:
+        print(f"   Best iterations ({scope}): {best_iterations[scope]}")
+    if budget_hits:
+        print(f"   ⚠️  {budget_hits} fit(s) stopped by the time budget")
 
-    lgb_temp = lgb.LGBMRegressor(**lgb_params)
-    lgb_temp.fit(X_tr, y_tr_log)
 
-    cat_temp = CatBoostRegressor(**cat_params)
-    cat_temp.fit(X_tr, y_tr_log)
+def ensemble_cv_scores(scope, y):
+    """Per-fold ensemble RMSE in the original and log space"""
+    rmse_scores, rmse_scores_log = [], []
+    for fold, (train_idx, val_idx) in enumerate(folds):
+        y_val = y[val_idx]
+        y_val_log = np.log1p(y_val)
 
-    # Ensemble predictions in log space
-    pred_xgb_log = xgb_temp.predict(X_val)
-    pred_lgb_log = lgb_temp.predict(X_val)
-    pred_cat_log = cat_temp.predict(X_val)
+        pred_xgb_log = results[(scope, 'xgb', fold)].val_pred
+        pred_lgb_log = results[(scope, 'lgb', fold)].val_pred
+        pred_cat_log = results[(scope, 'cat', fold)].val_pred
 
-    pred_ensemble_log = 0.40 * pred_xgb_log + \
-        0.35 * pred_lgb_log + 0.25 * pred_cat_log
+        w_xgb, w_lgb, w_cat = (ensemble_weights[family] for family in ['xgb', 'lgb', 'cat'])
 
-    # Convert to original space
-    pred_xgb = np.expm1(pred_xgb_log)
-    pred_lgb = np.expm1(pred_lgb_log)
-    pred_cat = np.expm1(pred_cat_log)
+        # Ensemble predictions in log space
+        pred_ensemble_log = w_xgb * pred_xgb_log + \
+            w_lgb * pred_lgb_log + w_cat * pred_cat_log
 
-    # Weighted average (XGB=40%, LGB=35%, CAT=25%)
-    pred_ensemble = 0.40 * pred_xgb + 0.35 * pred_lgb + 0.25 * pred_cat
-    pred_ensemble = np.maximum(pred_ensemble, 0)
+        # Weighted average in original space (default XGB=40%, LGB=35%, CAT=25%)
+        pred_ensemble = w_xgb * np.expm1(pred_xgb_log) + \
+            w_lgb * np.expm1(pred_lgb_log) + w_cat * np.expm1(pred_cat_log)
+        pred_ensemble = np.maximum(pred_ensemble, 0)
 
-    # Calculate RMSE in both spaces
-    rmse_log = np.sqrt(mean_squared_error(y_val_log, pred_ensemble_log))
-    rmse_orig = np.sqrt(mean_squared_error(y_val, pred_ensemble))
+        # Calculate RMSE in both spaces
+        rmse_scores_log.append(np.sqrt(mean_squared_error(y_val_log, pred_ensemble_log)))
+        rmse_scores.append(np.sqrt(mean_squared_error(y_val, pred_ensemble)))
+    return rmse_scores, rmse_scores_log
 
-    rmse_scores_log.append(rmse_log)
-    rmse_scores.append(rmse_orig)
 
+rmse_scores, rmse_scores_log = ensemble_cv_scores('s1', y_scope1)
 print(
     f"   ✅ Scope 1 CV RMSE (Original): {np.mean(rmse_scores):,.2f} ± {np.std(rmse_scores):,.2f}")
 print(
     f"   ✅ Scope 1 CV RMSE (Log):      {np.mean(rmse_scores_log):.4f} ± {np.std(rmse_scores_log):.4f}")
 
 # ============================================================================
-# 4. Train Ensemble for Scope 2
+# 4. Scope 2 Results
 # ============================================================================
-print("\n[4/6] Training Scope 2 ensemble...")
-
-y_scope2_log = np.log1p(y_scope2)
-
-# Train XGBoost
-print("   Training XGBoost...")
-xgb_s2 = xgb.XGBRegressor(**xgb_params)
-xgb_s2.fit(X_train, y_scope2_log)
-
-# Train LightGBM
-print("   Training LightGBM...")
-lgb_s2 = lgb.LGBMRegressor(**lgb_params)
-lgb_s2.fit(X_train, y_scope2_log)
-
-# Train CatBoost
-print("   Training CatBoost...")
-cat_s2 = CatBoostRegressor(**cat_params)
-cat_s2.fit(X_train, y_scope2_log)
-
-# Cross-validation
-rmse_scores_s2 = []
-rmse_scores_s2_log = []
-
-for train_idx, val_idx in kf.split(X_train):
-    X_tr, X_val = X_train.iloc[train_idx], X_train.iloc[val_idx]
-    y_tr, y_val = y_scope2[train_idx], y_scope2[val_idx]
-    y_tr_log = np.log1p(y_tr)
-    y_val_log = np.log1p(y_val)
-
-    xgb_temp = xgb.XGBRegressor(**xgb_params)
-    xgb_temp.fit(X_tr, y_tr_log)
-
-    lgb_temp = lgb.LGBMRegressor(**lgb_params)
-    lgb_temp.fit(X_tr, y_tr_log)
-
-    cat_temp = CatBoostRegressor(**cat_params)
-    cat_temp.fit(X_tr, y_tr_log)
-
-    # Ensemble predictions in log space
-    pred_xgb_log = xgb_temp.predict(X_val)
-    pred_lgb_log = lgb_temp.predict(X_val)
-    pred_cat_log = cat_temp.predict(X_val)
-
-    pred_ensemble_log = 0.40 * pred_xgb_log + \
-        0.35 * pred_lgb_log + 0.25 * pred_cat_log
-
-    # Convert to original space
-    pred_xgb = np.expm1(pred_xgb_log)
-    pred_lgb = np.expm1(pred_lgb_log)
-    pred_cat = np.expm1(pred_cat_log)
-
-    pred_ensemble = 0.40 * pred_xgb + 0.35 * pred_lgb + 0.25 * pred_cat
-    pred_ensemble = np.maximum(pred_ensemble, 0)
-
-    # Calculate RMSE in both spaces
-    rmse_log = np.sqrt(mean_squared_error(y_val_log, pred_ensemble_log))
-    rmse_orig = np.sqrt(mean_squared_error(y_val, pred_ensemble))
-
-    rmse_scores_s2_log.append(rmse_log)
-    rmse_scores_s2.append(rmse_orig)
+print("\n[4/6] Scope 2 ensemble...")
 
+rmse_scores_s2, rmse_scores_s2_log = ensemble_cv_scores('s2', y_scope2)
 print(
     f"   ✅ Scope 2 CV RMSE (Original): {np.mean(rmse_scores_s2):,.2f} ± {np.std(rmse_scores_s2):,.2f}")
 print(
@@ -286,32 +285,14 @@ print(
 # ============================================================================
 print("\n[4b/6] XGBoost-only (core features) 5-fold CV...")
 
-# Log-transform targets for core model
-y_scope1_log_core = np.log1p(y_scope1)
-y_scope2_log_core = np.log1p(y_scope2)
-
-kf_core = KFold(n_splits=5, shuffle=True, random_state=42)
-
 rmse_s1_core, rmse_s2_core = [], []
 
-for fold, (tr_idx, va_idx) in enumerate(kf_core.split(X_train_core), 1):
-    print(f"   Fold {fold}/5 ...")
-
-    X_tr, X_va = X_train_core.iloc[tr_idx], X_train_core.iloc[va_idx]
-    y1_tr_log, y1_va = y_scope1_log_core[tr_idx], y_scope1[va_idx]
-    y2_tr_log, y2_va = y_scope2_log_core[tr_idx], y_scope2[va_idx]
+for fold, (tr_idx, va_idx) in enumerate(folds):
+    pred_s1_va = np.maximum(np.expm1(results[('s1', 'xgb_core', fold)].val_pred), 0)
+    rmse_s1_core.append(np.sqrt(mean_squared_error(y_scope1[va_idx], pred_s1_va)))
 
-    # Scope 1 core model
-    model_s1_core = xgb.XGBRegressor(**xgb_core_params)
-    model_s1_core.fit(X_tr, y1_tr_log)
-    pred_s1_va = np.maximum(np.expm1(model_s1_core.predict(X_va)), 0)
-    rmse_s1_core.append(np.sqrt(mean_squared_error(y1_va, pred_s1_va)))
-
-    # Scope 2 core model
-    model_s2_core = xgb.XGBRegressor(**xgb_core_params)
-    model_s2_core.fit(X_tr, y2_tr_log)
-    pred_s2_va = np.maximum(np.expm1(model_s2_core.predict(X_va)), 0)
-    rmse_s2_core.append(np.sqrt(mean_squared_error(y2_va, pred_s2_va)))
+    pred_s2_va = np.maximum(np.expm1(results[('s2', 'xgb_core', fold)].val_pred), 0)
+    rmse_s2_core.append(np.sqrt(mean_squared_error(y_scope2[va_idx], pred_s2_va)))
 
 print("\n✅ XGBoost-only (core features) CV RMSE (ORIGINAL SCALE):")
 print(
@@ -321,26 +302,30 @@ print(
 
 print("\n🔁 Comparison vs ensemble (see Scope 1/2 CV RMSE logs above)")
 
+# Out-of-fold predictions (log space) for 03_test_model.py, so it can
+# evaluate without retraining; keyed by data + params + folds
+all_params = {**model_params, 'xgb_core': xgb_core_params, 'training': training_settings,
+              'fold_features': FOLD_FEATURES}
+training_digest = data_hash(X_train, y_scope1, y_scope2)
+oof_predictions = {}
+for scope in ['s1', 's2']:
+    for model in ['xgb', 'lgb', 'cat', 'xgb_core']:
+        pred = np.zeros(X_train.shape[0])
+        for fold, (train_idx, val_idx) in enumerate(folds):
+            pred[val_idx] = results[(scope, model, fold)].val_pred
+        oof_predictions[(scope, model)] = pred
+save_oof(OOF_FILE,
+         oof_key(training_digest, all_params, N_SPLITS, CV_SEED, library_versions()),
+         fold_ids(folds, X_train.shape[0]), oof_predictions)
+
 # ============================================================================
 # 5. Generate Test Predictions
 # ============================================================================
 print("\n[5/6] Generating ensemble predictions on test set...")
 
-# Scope 1 predictions
-pred_s1_xgb = np.expm1(xgb_s1.predict(X_test))
-pred_s1_lgb = np.expm1(lgb_s1.predict(X_test))
-pred_s1_cat = np.expm1(cat_s1.predict(X_test))
-
-pred_s1_ensemble = 0.40 * pred_s1_xgb + 0.35 * pred_s1_lgb + 0.25 * pred_s1_cat
-pred_s1_ensemble = np.maximum(pred_s1_ensemble, 0)
-
-# Scope 2 predictions
-pred_s2_xgb = np.expm1(xgb_s2.predict(X_test))
-pred_s2_lgb = np.expm1(lgb_s2.predict(X_test))
-pred_s2_cat = np.expm1(cat_s2.predict(X_test))
-
-pred_s2_ensemble = 0.40 * pred_s2_xgb + 0.35 * pred_s2_lgb + 0.25 * pred_s2_cat
-pred_s2_ensemble = np.maximum(pred_s2_ensemble, 0)
+# Weighted average in the original space
+pred_s1_ensemble = ensemble_predict(ensemble_models['s1'], X_test, ensemble_weights)
+pred_s2_ensemble = ensemble_predict(ensemble_models['s2'], X_test, ensemble_weights)
 
 print(
     f"   Scope 1: Min={pred_s1_ensemble.min():.2f}, Mean={pred_s1_ensemble.mean():.2f}, Max={pred_s1_ensemble.max():.2f}")
@@ -360,6 +345,32 @@ submission = pd.DataFrame({
 
 submission.to_csv('submission.csv', index=False)
 
+# Publish a new registry version: native model files, the fitted feature
+# pipeline and a manifest (consumed by 03_test_model.py and the backend's /predict)
+MODEL_DIR = 'models'
+registry = ModelRegistry(MODEL_DIR)
+model_version = registry.publish(
+    ensemble_models,
+    pipeline_path='feature_pipeline.json',
+    features=feature_names,
+    weights=ensemble_weights,
+    params=all_params,
+    data_digest=training_digest,
+    cv_scores={
+        's1': {'rmse': float(np.mean(rmse_scores)), 'rmse_std': float(np.std(rmse_scores)),
+               'rmse_log': float(np.mean(rmse_scores_log)), 'rmse_log_std': float(np.std(rmse_scores_log))},
+        's2': {'rmse': float(np.mean(rmse_scores_s2)), 'rmse_std': float(np.std(rmse_scores_s2)),
+               'rmse_log': float(np.mean(rmse_scores_s2_log)), 'rmse_log_std': float(np.std(rmse_scores_s2_log))},
+    },
+    attachments={OOF_FILE: OOF_FILE},
+    cv_folds={'n_splits': N_SPLITS, 'random_state': CV_SEED},
+    final_models=FINAL_MODELS,
+    best_iterations=best_iterations,
+    budget_hits=budget_hits,
+    training_seconds=round(train_seconds, 1),
+    full_fit_seconds=round(full_fit_seconds, 1),
+)
+
 print("\n" + "="*70)
 print("✅ MODEL TRAINING COMPLETE")
 print("="*70)
@@ -384,13 +395,16 @@ print(
     f"  Scope 2 RMSE:    {np.mean(rmse_scores_s2_log):>12.4f} ± {np.std(rmse_scores_s2_log):.4f}")
 print(f"  Combined RMSE:   {combined_rmse_log:>12.4f}")
 
+print(f"\nFinal models: {FINAL_MODELS} (training wall-clock {train_seconds:.1f}s)")
+
 print(f"\nEnsemble Composition:")
-print(f"  XGBoost:  40%")
-print(f"  LightGBM: 35%")
-print(f"  CatBoost: 25%")
+print(f"  XGBoost:  {ensemble_weights['xgb']:.0%}")
+print(f"  LightGBM: {ensemble_weights['lgb']:.0%}")
+print(f"  CatBoost: {ensemble_weights['cat']:.0%}")
 
 print(f"\nSubmission saved: submission.csv")
 print(f"  Rows: {len(submission)}")
 print(
     f"  No negative values: {(submission[['target_scope_1', 'target_scope_2']] >= 0).all().all()}")
+print(f"Models saved: {MODEL_DIR}/{model_version}/")
 print("="*70)
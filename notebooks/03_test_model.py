@@ -9,14 +9,17 @@ MODEL TESTING & EVALUATION
 
 import pandas as pd
 import numpy as np
-import xgboost as xgb
-import lightgbm as lgb
-from catboost import CatBoostRegressor
 from sklearn.model_selection import KFold
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score, mean_absolute_percentage_error
 import matplotlib.pyplot as plt
 import seaborn as sns
 import warnings
+from cv_executor import CVExecutor, Job
+from data_io import load_frame, load_matrix, read_table
+from ensemble import ensemble_predict
+from feature_pipeline import FeaturePipeline
+from model_registry import ModelRegistry, data_hash, library_versions
+from oof_cache import OOF_FILE, fold_ids, load_oof, oof_key, save_oof
 
 warnings.filterwarnings('ignore')
 
@@ -28,15 +31,17 @@ print("="*70)
 # 1. Load Data
 # ============================================================================
 print("\n[1/5] Loading data...")
-X_train = pd.read_csv('X_train.csv')
-X_test = pd.read_csv('X_test.csv')
-y_scope1 = pd.read_csv('y_scope1.csv').values.ravel()
-y_scope2 = pd.read_csv('y_scope2.csv').values.ravel()
-test_ids = pd.read_csv('test_ids.csv').values.ravel()
+# Dense frames, or CSR matrices when 01 ran with SPARSE_FEATURES / NACE_LEVEL_2
+load_features = load_matrix if FeaturePipeline.load('feature_pipeline.json').is_sparse else load_frame
+X_train = load_features('X_train')
+X_test = load_features('X_test')
+y_scope1 = load_frame('y_scope1').values.ravel()
+y_scope2 = load_frame('y_scope2').values.ravel()
+test_ids = load_frame('test_ids').values.ravel()
 submission = pd.read_csv('submission.csv')
 
-print(f"   Training samples: {len(X_train)}")
-print(f"   Test samples: {len(X_test)}")
+print(f"   Training samples: {X_train.shape[0]}")
+print(f"   Test samples: {X_test.shape[0]}")
 print(f"   Features: {X_train.shape[1]}")
 
 # ============================================================================
@@ -44,7 +49,7 @@ print(f"   Features: {X_train.shape[1]}")
 # ============================================================================
 print("\n[1b/5] Running EDA and creating visualizations (saved under ../figures)...")
 
-train_raw = pd.read_csv('../data/train.csv')
+train_raw = read_table('../data/train.csv')
 
 eda_output_dir = '../figures'
 
@@ -146,53 +151,75 @@ if len(num_cols) >= 2:
     _save_fig('eda_correlation_heatmap.png')
 
 # ============================================================================
-# 2. Train Models for Testing
+# 2. Load Model Artifacts
 # ============================================================================
-print("\n[2/5] Training models for evaluation...")
-
-# Model parameters (same as training)
-xgb_params = {
-    'n_estimators': 500,
-    'max_depth': 4,
-    'learning_rate': 0.03,
-    'subsample': 0.7,
-    'colsample_bytree': 0.7,
-    'min_child_weight': 10,
-    'reg_alpha': 1.0,
-    'reg_lambda': 2.0,
-    'random_state': 42,
-    'n_jobs': -1
-}
+print("\n[2/5] Loading model artifacts...")
 
-lgb_params = {
-    'n_estimators': 500,
-    'max_depth': 5,
-    'learning_rate': 0.03,
-    'subsample': 0.7,
-    'colsample_bytree': 0.7,
-    'min_child_samples': 20,
-    'reg_alpha': 0.5,
-    'reg_lambda': 1.5,
-    'random_state': 42,
-    'n_jobs': -1,
-    'verbose': -1
-}
+# Latest version published by 02_model_training.py (native model files + manifest)
+artifact = ModelRegistry('models').load()
+manifest = artifact.manifest
 
-cat_params = {
-    'iterations': 500,
-    'depth': 5,
-    'learning_rate': 0.03,
-    'l2_leaf_reg': 3.0,
-    'random_seed': 42,
-    'verbose': False
-}
+# Model parameters (same as training, read from the manifest)
+xgb_params = manifest['params']['xgb']
+lgb_params = manifest['params']['lgb']
+cat_params = manifest['params']['cat']
+
+training_digest = data_hash(X_train, y_scope1, y_scope2)
+data_matches_artifact = manifest['data_hash'] == training_digest
+print(f"   Model version: {artifact.version}")
+if not data_matches_artifact:
+    print("   ⚠️  X_train/targets changed since these models were trained; rerun 02_model_training.py")
 
 # ============================================================================
 # 3. Cross-Validation Evaluation
 # ============================================================================
-print("\n[3/5] Running 5-fold cross-validation...")
-
-kf = KFold(n_splits=5, shuffle=True, random_state=42)
+print("\n[3/5] Evaluating 5-fold cross-validation predictions...")
+
+N_SPLITS, CV_SEED = 5, 42
+
+# Out-of-fold predictions saved by 02_model_training.py; only recomputed when
+# the data, parameters, folds or library versions no longer match
+cache_key = oof_key(training_digest, manifest['params'], N_SPLITS, CV_SEED, library_versions())
+cached = load_oof(ModelRegistry('models').path(artifact.version) / OOF_FILE, cache_key) or \
+    load_oof(OOF_FILE, cache_key)
+
+if cached is not None:
+    print("   ✅ Using cached out-of-fold predictions")
+    fold_of_row, oof_predictions = cached
+else:
+    print("   OOF cache missing or stale, retraining fold models...")
+    kf = KFold(n_splits=N_SPLITS, shuffle=True, random_state=CV_SEED)
+    folds = list(kf.split(X_train))
+    # Same fold-aware features as training (target encodings refit per fold)
+    fold_features = manifest['params'].get('fold_features', False)
+    fold_frames = None
+    if fold_features:
+        train_frames = {'companies': read_table("../data/train.csv")}  # fold features only need the company rows
+        fold_frames = artifact.pipeline.fold_features(train_frames, X_train, folds)
+    jobs = [
+        Job((scope, family, fold), family, params, scope,
+            columns=None, train_idx=train_idx, val_idx=val_idx, keep_model=False,
+            frame=fold if fold_features else None)
+        for scope in ['s1', 's2']
+        for family, params in [('xgb', xgb_params), ('lgb', lgb_params), ('cat', cat_params)]
+        for fold, (train_idx, val_idx) in enumerate(folds)
+    ]
+    results = CVExecutor(**manifest['params'].get('training', {})).run(
+        jobs, X_train, {'s1': np.log1p(y_scope1), 's2': np.log1p(y_scope2)}, frames=fold_frames)
+    fold_of_row = fold_ids(folds, X_train.shape[0])
+    oof_predictions = {}
+    for scope in ['s1', 's2']:
+        for family in ['xgb', 'lgb', 'cat']:
+            pred = np.zeros(X_train.shape[0])
+            for fold, (train_idx, val_idx) in enumerate(folds):
+                pred[val_idx] = results[(scope, family, fold)].val_pred
+            oof_predictions[(scope, family)] = pred
+    save_oof(OOF_FILE, cache_key, fold_of_row, oof_predictions)
+
+# Ensemble blend in log space (same weights as training)
+weights = manifest['weights']
+oof_s1_log = sum(weights[family] * oof_predictions[('s1', family)] for family in ['xgb', 'lgb', 'cat'])
+oof_s2_log = sum(weights[family] * oof_predictions[('s2', family)] for family in ['xgb', 'lgb', 'cat'])
 
 # Storage for predictions and metrics
 all_metrics_s1 = []
@@ -202,49 +229,17 @@ all_preds_s2 = []
 all_true_s1 = []
 all_true_s2 = []
 
-for fold_idx, (train_idx, val_idx) in enumerate(kf.split(X_train)):
-    print(f"\n   Fold {fold_idx + 1}/5...")
+for fold_idx in range(N_SPLITS):
+    print(f"\n   Fold {fold_idx + 1}/{N_SPLITS}...")
 
-    X_tr, X_val = X_train.iloc[train_idx], X_train.iloc[val_idx]
-    y_s1_tr, y_s1_val = y_scope1[train_idx], y_scope1[val_idx]
-    y_s2_tr, y_s2_val = y_scope2[train_idx], y_scope2[val_idx]
-
-    # Log transform
-    y_s1_tr_log = np.log1p(y_s1_tr)
-    y_s2_tr_log = np.log1p(y_s2_tr)
+    val_idx = np.flatnonzero(fold_of_row == fold_idx)
+    y_s1_val, y_s2_val = y_scope1[val_idx], y_scope2[val_idx]
     y_s1_val_log = np.log1p(y_s1_val)
     y_s2_val_log = np.log1p(y_s2_val)
 
-    # Train Scope 1 models
-    xgb_s1 = xgb.XGBRegressor(**xgb_params)
-    xgb_s1.fit(X_tr, y_s1_tr_log)
-
-    lgb_s1 = lgb.LGBMRegressor(**lgb_params)
-    lgb_s1.fit(X_tr, y_s1_tr_log)
-
-    cat_s1 = CatBoostRegressor(**cat_params)
-    cat_s1.fit(X_tr, y_s1_tr_log)
-
-    # Scope 1 predictions
-    pred_s1_log = (0.40 * xgb_s1.predict(X_val) +
-                   0.35 * lgb_s1.predict(X_val) +
-                   0.25 * cat_s1.predict(X_val))
+    pred_s1_log = oof_s1_log[val_idx]
     pred_s1 = np.maximum(np.expm1(pred_s1_log), 0)
-
-    # Train Scope 2 models
-    xgb_s2 = xgb.XGBRegressor(**xgb_params)
-    xgb_s2.fit(X_tr, y_s2_tr_log)
-
-    lgb_s2 = lgb.LGBMRegressor(**lgb_params)
-    lgb_s2.fit(X_tr, y_s2_tr_log)
-
-    cat_s2 = CatBoostRegressor(**cat_params)
-    cat_s2.fit(X_tr, y_s2_tr_log)
-
-    # Scope 2 predictions
-    pred_s2_log = (0.40 * xgb_s2.predict(X_val) +
-                   0.35 * lgb_s2.predict(X_val) +
-                   0.25 * cat_s2.predict(X_val))
+    pred_s2_log = oof_s2_log[val_idx]
     pred_s2 = np.maximum(np.expm1(pred_s2_log), 0)
 
     # Store predictions
@@ -311,16 +306,20 @@ combined_rmse_log = np.sqrt(
 print("\n[5/5] Validating submission file...")
 
 # Load training data to compare distributions
-train = pd.read_csv('../data/train.csv')
+train = read_table('../data/train.csv')
 
 # Check submission
 submission_checks = {
     'total_predictions': len(submission),
-    'expected_predictions': len(X_test),
+    'expected_predictions': X_test.shape[0],
     'no_missing_values': not submission.isnull().any().any(),
     'no_negative_scope1': (submission['target_scope_1'] >= 0).all(),
     'no_negative_scope2': (submission['target_scope_2'] >= 0).all(),
-    'all_ids_present': len(submission) == len(test_ids)
+    'all_ids_present': len(submission) == len(test_ids),
+    'training_data_matches_models': data_matches_artifact,
+    'matches_saved_models': bool(
+        np.allclose(submission['target_scope_1'], ensemble_predict(artifact.models['s1'], X_test, weights)) and
+        np.allclose(submission['target_scope_2'], ensemble_predict(artifact.models['s2'], X_test, weights))),
 }
 
 # ============================================================================
@@ -357,6 +356,11 @@ print(
 print(
     f"  R²:               {avg_metrics_s2['r2']:>12.4f} ± {std_metrics_s2['r2']:.4f}")
 
+print("\nTraining-time CV (from the model manifest):")
+for scope, name in [('s1', 'Scope 1'), ('s2', 'Scope 2')]:
+    scores = manifest['cv_scores'][scope]
+    print(f"  {name} RMSE:     {scores['rmse']:>12,.2f} ± {scores['rmse_std']:,.2f}")
+
 print("\nCombined Metrics:")
 print(f"  RMSE (Original):  {combined_rmse_orig:>12,.2f}")
 print(f"  RMSE (Log):       {combined_rmse_log:>12.4f}")
@@ -9,6 +9,7 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import warnings
+from data_io import load_frame, read_table
 warnings.filterwarnings('ignore')
 
 # Set style
@@ -28,15 +29,15 @@ print("🎨 Generating visualizations for presentation...")
 # Load Data
 # ============================================================================
 print("\n📂 Loading data...")
-train_df = pd.read_csv('../data/train.csv')
-test_df = pd.read_csv('../data/test.csv')
-sector_df = pd.read_csv('../data/revenue_distribution_by_sector.csv')
-env_df = pd.read_csv('../data/environmental_activities.csv')
-sdg_df = pd.read_csv('../data/sustainable_development_goals.csv')
+train_df = read_table('../data/train.csv')
+test_df = read_table('../data/test.csv')
+sector_df = read_table('../data/revenue_distribution_by_sector.csv')
+env_df = read_table('../data/environmental_activities.csv')
+sdg_df = read_table('../data/sustainable_development_goals.csv')
 
 # Load engineered features if available
 try:
-    X_train = pd.read_csv('X_train.csv')
+    X_train = load_frame('X_train')
     y_train_s1 = pd.read_csv('y_train_s1.csv').values.ravel()
     y_train_s2 = pd.read_csv('y_train_s2.csv').values.ravel()
     print("✅ Loaded engineered features")
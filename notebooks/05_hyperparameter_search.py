@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+HYPERPARAMETER SEARCH - successive halving over the ensemble
+- Samples XGBoost / LightGBM / CatBoost parameters (param_search.SEARCH_SPACE)
+- Successive halving on boosting rounds, same 5-fold CV as training
+- Blend weights chosen per trial from out-of-fold predictions
+- Trials run in parallel (CV_WORKERS) and are checkpointed, rerun to resume
+- Writes best_config.json, used by: PARAMS_FILE=best_config.json python 02_model_training.py
+"""
+
+import json
+import os
+import time
+from sklearn.model_selection import KFold
+import warnings
+from cv_executor import CVExecutor
+from data_io import load_frame, load_matrix, read_table
+from feature_pipeline import FeaturePipeline
+from param_search import SuccessiveHalving
+warnings.filterwarnings('ignore')
+
+print("="*70)
+print("HYPERPARAMETER SEARCH - SUCCESSIVE HALVING")
+print("="*70)
+
+# ============================================================================
+# 1. Load Engineered Features
+# ============================================================================
+print("\n[1/3] Loading engineered features...")
+pipeline = FeaturePipeline.load('feature_pipeline.json')
+X_train = load_matrix('X_train') if pipeline.is_sparse else load_frame('X_train')
+y_scope1 = load_frame('y_scope1').values.ravel()
+y_scope2 = load_frame('y_scope2').values.ravel()
+
+print(f"   Features: {X_train.shape[1]}")
+print(f"   Training samples: {X_train.shape[0]}")
+
+# ============================================================================
+# 2. Run (or Resume) the Search
+# ============================================================================
+print("\n[2/3] Searching...")
+
+N_TRIALS = int(os.getenv('SEARCH_TRIALS', '27'))
+ETA = int(os.getenv('SEARCH_ETA', '3'))
+MIN_ROUNDS = int(os.getenv('SEARCH_MIN_ROUNDS', '100'))
+MAX_ROUNDS = int(os.getenv('SEARCH_MAX_ROUNDS', '900'))
+SEARCH_SEED = int(os.getenv('SEARCH_SEED', '42'))
+SEARCH_DIR = os.getenv('SEARCH_DIR', 'search')
+
+# Same folds (and fold-aware target encodings, FOLD_FEATURES) as 02_model_training.py
+kf = KFold(n_splits=5, shuffle=True, random_state=42)
+folds = list(kf.split(X_train))
+FOLD_FEATURES = os.getenv('FOLD_FEATURES', '1') != '0'
+fold_frames = None
+if FOLD_FEATURES:
+    train_frames = {'companies': read_table("../data/train.csv")}  # fold features only need the company rows
+    fold_frames = pipeline.fold_features(train_frames, X_train, folds)
+
+executor = CVExecutor()
+search = SuccessiveHalving(
+    executor, X_train, {'s1': y_scope1, 's2': y_scope2}, folds,
+    n_trials=N_TRIALS, eta=ETA, min_rounds=MIN_ROUNDS, max_rounds=MAX_ROUNDS, seed=SEARCH_SEED,
+    results_path=f"{SEARCH_DIR}/trials_seed{SEARCH_SEED}_n{N_TRIALS}{'_fold' if FOLD_FEATURES else ''}.jsonl",
+    fold_frames=fold_frames,
+)
+print(f"   {N_TRIALS} trials, eta={ETA}, rounds per rung: {search.rungs()}")
+print(f"   {executor.n_workers} worker(s) x {executor.n_threads} thread(s), results: {search.results_path}")
+
+start = time.perf_counter()
+best = search.run()
+print(f"   ✅ Search finished in {time.perf_counter() - start:.1f}s")
+
+# ============================================================================
+# 3. Save Best Configuration
+# ============================================================================
+print("\n[3/3] Saving best configuration...")
+
+best_config = search.best_config(best)
+with open('best_config.json', 'w') as f:
+    json.dump(best_config, f, indent=2)
+
+print("\n" + "="*70)
+print("✅ HYPERPARAMETER SEARCH COMPLETE")
+print("="*70)
+print(f"Best trial: {best['trial']} ({best['rounds']} rounds)")
+print(f"  Combined CV RMSE: {best['score']:>12,.2f}")
+print(f"  Scope 1 RMSE:     {best['scope_scores']['s1']:>12,.2f}")
+print(f"  Scope 2 RMSE:     {best['scope_scores']['s2']:>12,.2f}")
+print(f"  Blend weights:    XGB={best['weights']['xgb']:.0%}, LGB={best['weights']['lgb']:.0%}, "
+      f"CAT={best['weights']['cat']:.0%}")
+for family, params in best['config'].items():
+    print(f"  {family}: " + ", ".join(f"{k}={v:.4g}" for k, v in params.items()))
+print("\nFiles saved:")
+print("  - best_config.json")
+print("\nTrain with it:")
+print("  PARAMS_FILE=best_config.json python3 02_model_training.py")
+print("="*70)
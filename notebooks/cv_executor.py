@@ -0,0 +1,199 @@
+"""
+Parallel fitting of fold x model x target jobs for 02_model_training.py.
+
+Every fit (cross-validation folds and the final full-data models) is a Job.
+CVExecutor runs the jobs on a process pool and gives each job a fixed share
+of the cores (n_jobs / thread_count), so the libraries' own thread pools do
+not oversubscribe the machine. Results come back keyed by job and in
+submission order whatever the completion order, and every model has a fixed
+seed, so a run is reproducible for a given worker/thread layout.
+
+Workers receive the training data once (pool initializer); jobs only carry
+row indices. A job can name an alternative feature frame (Job.frame, passed
+to run() as frames), e.g. the per-fold matrices with fold-refit target
+encodings built by FeaturePipeline.fold_features(). Without fork (e.g. Windows) or with n_workers=1 the jobs run
+in-process, one after another.
+
+Optional training controls (off by default):
+- early_stopping_rounds: stop each booster once its validation RMSE has not
+  improved for that many rounds. CV jobs use their fold's validation rows;
+  full-data jobs hold out an inner split (inner_val_fraction) for it.
+- time_budget: wall-clock seconds per fit; boosting stops after the round
+  that exceeds it.
+Each result records best_iteration, the number of boosting rounds kept.
+"""
+
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# train_idx=None fits on every row; val_idx=None skips validation predictions.
+# keep_model returns the fitted model (final models) instead of dropping it (CV folds).
+# frame selects one of run()'s frames instead of X (None = X).
+Job = namedtuple('Job', 'key family params target columns train_idx val_idx keep_model frame', defaults=(None,))
+JobResult = namedtuple('JobResult', 'key model val_pred seconds best_iteration budget_hit')
+
+THREAD_PARAM = {'xgb': 'n_jobs', 'lgb': 'n_jobs', 'cat': 'thread_count'}
+
+_worker_state = {}
+
+
+def _rows(X, idx):
+    """Rows of a frame or of a scipy sparse matrix"""
+    return X.iloc[idx] if hasattr(X, 'iloc') else X[idx]
+
+
+def make_model(family, params, n_threads):
+    """Unfitted model of one family, limited to n_threads"""
+    params = {**params, THREAD_PARAM[family]: n_threads}
+    if family == 'xgb':
+        import xgboost as xgb
+        return xgb.XGBRegressor(**params)
+    if family == 'lgb':
+        import lightgbm as lgb
+        return lgb.LGBMRegressor(**params)
+    if family == 'cat':
+        from catboost import CatBoostRegressor
+        return CatBoostRegressor(**params)
+    raise ValueError(f'Unknown model family: {family}')
+
+
+def inner_split(n_rows, fraction, seed=42):
+    """(train positions, validation positions) for early stopping a full-data fit"""
+    order = np.random.default_rng(seed).permutation(n_rows)
+    n_val = max(1, int(round(n_rows * fraction)))
+    return np.sort(order[n_val:]), np.sort(order[:n_val])
+
+
+def fit_model(family, model, X_tr, y_tr, X_es=None, y_es=None, early_stopping_rounds=0, time_budget=None):
+    """
+    Fit one model, early-stopping on (X_es, y_es) when given and stopping at
+    the time budget. Returns the number of boosting rounds kept.
+    """
+    deadline = None if not time_budget else time.perf_counter() + time_budget
+    stop = bool(early_stopping_rounds) and X_es is not None
+
+    def expired():
+        return deadline is not None and time.perf_counter() > deadline
+
+    if family == 'xgb':
+        import xgboost as xgb
+
+        class Budget(xgb.callback.TrainingCallback):
+            def after_iteration(self, model, epoch, evals_log):
+                return expired()
+
+        model.set_params(early_stopping_rounds=early_stopping_rounds if stop else None,
+                         callbacks=[Budget()] if deadline else None)
+        model.fit(X_tr, y_tr, eval_set=[(X_es, y_es)] if stop else None, verbose=False)
+        model.set_params(callbacks=None)  # keep the fitted model picklable
+        return model.best_iteration + 1 if stop else model.get_booster().num_boosted_rounds()
+
+    if family == 'lgb':
+        import lightgbm as lgb
+
+        def budget(env):
+            if expired():
+                raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+
+        callbacks = ([lgb.early_stopping(early_stopping_rounds, verbose=False)] if stop else []) + \
+            ([budget] if deadline else [])
+        model.fit(X_tr, y_tr, eval_set=[(X_es, y_es)] if stop else None, callbacks=callbacks)
+        return model.best_iteration_ or model.booster_.current_iteration()
+
+    if family == 'cat':
+        class Budget:
+            def after_iteration(self, info):
+                return not expired()
+
+        model.fit(X_tr, y_tr, eval_set=(X_es, y_es) if stop else None,
+                  early_stopping_rounds=early_stopping_rounds if stop else None,
+                  callbacks=[Budget()] if deadline else None)
+        return model.tree_count_  # with an eval set the model is shrunk to its best iteration
+
+    raise ValueError(f'Unknown model family: {family}')
+
+
+def _init_worker(X, targets, n_threads, settings, frames=None):
+    _worker_state['X'] = X
+    _worker_state['frames'] = frames or {}
+    _worker_state['targets'] = targets
+    _worker_state['n_threads'] = n_threads
+    _worker_state['settings'] = settings
+
+
+def fit_job(job):
+    started = time.perf_counter()
+    X = _worker_state['X'] if job.frame is None else _worker_state['frames'][job.frame]
+    if job.columns is not None:
+        X = X[job.columns] if hasattr(X, 'iloc') else X[:, job.columns]
+    y = _worker_state['targets'][job.target]
+    settings = _worker_state['settings']
+
+    train_idx = np.arange(X.shape[0]) if job.train_idx is None else job.train_idx
+    es_idx = job.val_idx
+    if settings['early_stopping_rounds'] and es_idx is None:
+        inner_tr, inner_val = inner_split(len(train_idx), settings['inner_val_fraction'])
+        train_idx, es_idx = train_idx[inner_tr], train_idx[inner_val]
+
+    model = make_model(job.family, job.params, _worker_state['n_threads'])
+    best_iteration = fit_model(
+        job.family, model, _rows(X, train_idx), y[train_idx],
+        None if es_idx is None else _rows(X, es_idx), None if es_idx is None else y[es_idx],
+        early_stopping_rounds=settings['early_stopping_rounds'],
+        time_budget=settings['time_budget'],
+    )
+    seconds = time.perf_counter() - started
+    budget_hit = bool(settings['time_budget']) and seconds > settings['time_budget']
+
+    val_pred = None if job.val_idx is None else model.predict(_rows(X, job.val_idx))
+    return JobResult(job.key, model if job.keep_model else None, val_pred, seconds, best_iteration, budget_hit)
+
+
+def default_workers():
+    return int(os.getenv('CV_WORKERS', os.cpu_count() or 1))
+
+
+class CVExecutor:
+    def __init__(self, n_workers=None, n_threads=None, early_stopping_rounds=0, time_budget=None,
+                 inner_val_fraction=0.1):
+        self.n_workers = max(1, n_workers or default_workers())
+        cores = os.cpu_count() or 1
+        # Split the cores between workers: 32 cores / 8 workers -> 4 threads per fit
+        self.n_threads = n_threads or max(1, cores // self.n_workers)
+        self.settings = {
+            'early_stopping_rounds': early_stopping_rounds or 0,
+            'time_budget': time_budget or None,
+            'inner_val_fraction': inner_val_fraction,
+        }
+
+    def run(self, jobs, X, targets, frames=None):
+        """
+        Fit every job. targets maps target name -> (log-space) array aligned
+        with X; frames maps name -> alternative feature frame (same rows as X)
+        for jobs with a frame. Returns {job.key: JobResult} in job order.
+        """
+        jobs = list(jobs)
+        keys = [job.key for job in jobs]
+        if len(set(keys)) != len(keys):
+            raise ValueError('Job keys must be unique')
+        targets = {name: np.asarray(values) for name, values in targets.items()}
+
+        n_workers = min(self.n_workers, len(jobs))
+        if n_workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            _init_worker(X, targets, self.n_threads, self.settings, frames)
+            try:
+                results = [fit_job(job) for job in jobs]
+            finally:
+                _worker_state.clear()
+        else:
+            # fork: workers inherit the imported libraries and need no __main__ guard
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(n_workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(X, targets, self.n_threads, self.settings, frames)) as pool:
+                results = list(pool.map(fit_job, jobs))
+        return {result.key: result for result in results}
@@ -0,0 +1,113 @@
+"""
+Typed columnar storage for the project's tables.
+
+read_table(csv_path) parses a CSV once and keeps an Arrow IPC copy under
+<csv dir>/.arrow/. Later reads memory-map that copy instead of parsing
+text. The copy records the CSV's mtime and size, so editing the CSV makes it
+stale and the next read falls back to the CSV and rewrites the copy.
+
+save_frame / load_frame store intermediate frames (engineered features,
+targets) as Arrow IPC, which keeps dtypes that a CSV round trip loses.
+save_matrix / load_matrix do the same for sparse feature matrices (.npz).
+
+pyarrow is optional. Without it everything falls back to plain CSV.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import scipy.sparse as sp
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+ARROW_DIR = ".arrow"
+_STAMP_KEY = b"source_stamp"
+
+
+def _source_stamp(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}".encode()
+
+
+def _arrow_path(csv_path):
+    return csv_path.parent / ARROW_DIR / (csv_path.stem + ".arrow")
+
+
+def _write_arrow(df, path, metadata=None):
+    """Write df to path atomically (readers never see a partial file)"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_arrow(path):
+    """Memory-map an Arrow IPC file; returns (DataFrame, schema metadata)"""
+    with pa.memory_map(str(path), "r") as source:
+        table = ipc.open_file(source).read_all()
+    return table.to_pandas(), table.schema.metadata or {}
+
+
+def read_table(csv_path):
+    """DataFrame for csv_path, served from its Arrow copy when that is fresh"""
+    csv_path = Path(csv_path)
+    if pa is None:
+        return pd.read_csv(csv_path)
+
+    stamp = _source_stamp(csv_path)
+    arrow_path = _arrow_path(csv_path)
+    if arrow_path.exists():
+        try:
+            df, metadata = _read_arrow(arrow_path)
+            if metadata.get(_STAMP_KEY) == stamp:
+                return df
+        except (OSError, pa.ArrowInvalid):
+            pass  # unreadable copy: rebuild it below
+
+    df = pd.read_csv(csv_path)
+    try:
+        _write_arrow(df, arrow_path, {_STAMP_KEY: stamp})
+    except OSError as e:
+        print(f"Could not write Arrow copy of {csv_path.name}: {e}")
+    return df
+
+
+def save_frame(df, path):
+    """Save df as <path>.arrow (or <path>.csv without pyarrow)"""
+    path = Path(path)
+    if pa is None:
+        df.to_csv(path.with_suffix(".csv"), index=False)
+    else:
+        _write_arrow(df, path.with_suffix(".arrow"))
+
+
+def load_frame(path):
+    """Load a frame saved by save_frame, falling back to a CSV of the same name"""
+    path = Path(path)
+    arrow_path = path.with_suffix(".arrow")
+    if pa is not None and arrow_path.exists():
+        return _read_arrow(arrow_path)[0]
+    return pd.read_csv(path.with_suffix(".csv"))
+
+
+def save_matrix(matrix, path):
+    """Save a scipy sparse matrix as <path>.npz (CSR)"""
+    path = Path(path).with_suffix(".npz")
+    tmp_path = path.with_name(path.stem + f".{os.getpid()}.tmp.npz")
+    sp.save_npz(tmp_path, sp.csr_matrix(matrix))
+    os.replace(tmp_path, path)
+
+
+def load_matrix(path):
+    """Load a matrix saved by save_matrix"""
+    return sp.load_npz(Path(path).with_suffix(".npz")).tocsr()
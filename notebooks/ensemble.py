@@ -0,0 +1,150 @@
+"""
+The XGBoost + LightGBM + CatBoost ensemble shared by 02_model_training.py
+and the backend's /predict endpoint.
+
+Models are trained on log1p(target) and blended in the original space.
+save_ensemble() writes every model in its library's native format, together
+with the fitted FeaturePipeline, so the directory is all a consumer needs:
+
+    models/
+        feature_pipeline.json
+        xgb_s1.json  lgb_s1.txt  cat_s1.cbm
+        xgb_s2.json  lgb_s2.txt  cat_s2.cbm
+
+When the CV fold models are used as the final ensemble (FINAL_MODELS=folds
+in 02_model_training.py) each entry is a FoldAverage, stored as one file
+per fold: xgb_s1_fold0.json, xgb_s1_fold1.json, ...
+"""
+
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+# Weighted average (XGB=40%, LGB=35%, CAT=25%)
+ENSEMBLE_WEIGHTS = {'xgb': 0.40, 'lgb': 0.35, 'cat': 0.25}
+SCOPES = ('s1', 's2')
+MODEL_FILES = {'xgb': '{}.json', 'lgb': '{}.txt', 'cat': '{}.cbm'}
+PIPELINE_FILE = 'feature_pipeline.json'
+
+# Default model parameters (heavy regularization). 02_model_training.py trains
+# with these unless a best_config.json from 05_hyperparameter_search.py is given.
+DEFAULT_PARAMS = {
+    # XGBoost with heavy regularization
+    'xgb': {
+        'n_estimators': 500,
+        'max_depth': 4,  # Shallow trees
+        'learning_rate': 0.03,  # Slow learning
+        'subsample': 0.7,
+        'colsample_bytree': 0.7,
+        'min_child_weight': 10,  # Heavy regularization
+        'reg_alpha': 1.0,  # L1 regularization
+        'reg_lambda': 2.0,  # L2 regularization
+        'random_state': 42,
+        'n_jobs': -1
+    },
+    # LightGBM with different regularization
+    'lgb': {
+        'n_estimators': 500,
+        'max_depth': 5,
+        'learning_rate': 0.03,
+        'subsample': 0.7,
+        'colsample_bytree': 0.7,
+        'min_child_samples': 20,
+        'reg_alpha': 0.5,
+        'reg_lambda': 1.5,
+        'random_state': 42,
+        'n_jobs': -1,
+        'verbose': -1
+    },
+    # CatBoost with L2 leaf regularization
+    'cat': {
+        'iterations': 500,
+        'depth': 5,
+        'learning_rate': 0.03,
+        'l2_leaf_reg': 3.0,  # Heavy L2 regularization
+        'random_seed': 42,
+        'verbose': False
+    },
+}
+# Parameter holding the number of boosting rounds for each family
+ROUNDS_PARAM = {'xgb': 'n_estimators', 'lgb': 'n_estimators', 'cat': 'iterations'}
+
+
+class FoldAverage:
+    """Fold models used as one model: averages their (log-space) predictions"""
+
+    def __init__(self, models):
+        self.models = list(models)
+
+    def predict(self, X):
+        return np.mean([model.predict(X) for model in self.models], axis=0)
+
+
+def model_files(family, scope, model):
+    """File names used for one ensemble member"""
+    pattern = MODEL_FILES[family]
+    if isinstance(model, FoldAverage):
+        return [pattern.format(f'{family}_{scope}_fold{i}') for i in range(len(model.models))]
+    return [pattern.format(f'{family}_{scope}')]
+
+
+def _save_model(family, model, path):
+    if family == 'lgb':
+        model.booster_.save_model(str(path))
+    else:
+        model.save_model(str(path))
+
+
+def _load_model(family, path):
+    if family == 'xgb':
+        import xgboost as xgb
+        model = xgb.XGBRegressor()
+        model.load_model(str(path))
+        return model
+    if family == 'lgb':
+        import lightgbm as lgb
+        return lgb.Booster(model_file=str(path))
+    from catboost import CatBoostRegressor
+    return CatBoostRegressor().load_model(str(path))
+
+
+def ensemble_predict(models, X, weights=ENSEMBLE_WEIGHTS):
+    """Blend one scope's models ({family: model}) into non-negative predictions"""
+    pred = sum(weight * np.expm1(models[family].predict(X)) for family, weight in weights.items())
+    return np.maximum(pred, 0)
+
+
+def save_ensemble(models, directory, pipeline_path=None):
+    """Write {scope: {family: model}} in native formats (plus the feature pipeline)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for scope, family_models in models.items():
+        for family, model in family_models.items():
+            members = model.models if isinstance(model, FoldAverage) else [model]
+            for member, name in zip(members, model_files(family, scope, model)):
+                _save_model(family, member, directory / name)
+    if pipeline_path is not None:
+        shutil.copyfile(pipeline_path, directory / PIPELINE_FILE)
+    return directory
+
+
+def load_ensemble(directory):
+    """Load the models written by save_ensemble as {scope: {family: model}}"""
+    directory = Path(directory)
+    models = {}
+    for scope in SCOPES:
+        models[scope] = {}
+        for family, pattern in MODEL_FILES.items():
+            path = directory / pattern.format(f'{family}_{scope}')
+            if path.exists():
+                models[scope][family] = _load_model(family, path)
+                continue
+            fold_paths = sorted(
+                directory.glob(pattern.format(f'{family}_{scope}_fold*')),
+                key=lambda p: int(re.search(r'_fold(\d+)\.', p.name).group(1)))
+            if not fold_paths:
+                raise FileNotFoundError(f"Missing model file in {directory}: {path.name}")
+            models[scope][family] = FoldAverage(_load_model(family, p) for p in fold_paths)
+    return models
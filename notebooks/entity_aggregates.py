@@ -0,0 +1,247 @@
+"""
+Per-entity aggregates of the auxiliary tables (sectors, environmental
+activities, SDGs), used by FeaturePipeline.
+
+Every feature built from these tables is a function of a small per-entity
+state:
+- KeySums: the sum of a value (or the row count) per (entity, key) pair,
+  e.g. revenue share per NACE code or rows per SDG. The sector shares,
+  their count / max / entropy and the SDG totals come from these.
+- ValueStats: count, sum, min, max and the Welford mean / M2 of a value per
+  entity (the environmental aggregates, ENV_AGGREGATES).
+
+The states are updated one chunk of rows at a time, so a table can be
+streamed from disk (read_aggregates()) and memory is bounded by the number
+of entities (and pairs), not by the number of rows. The in-memory path
+(from_frames()) is the same code on a single chunk.
+
+Entropy is not a per-row statistic: the sector entropy is computed from the
+per-(entity, code) revenue shares once they are complete, so only the
+KeySums are carried between chunks.
+
+Results do not depend on the chunk boundaries: rows are folded into the
+state in file order, one "rank" at a time (the k-th row of every entity in
+the chunk together), so each entity sees exactly the sequence of float
+operations of a row-by-row loop. ValueStats reproduces pandas' groupby
+kernels (Kahan-compensated sum / mean, Welford variance), so its frame()
+is bit-identical to groupby().agg(ENV_AGGREGATES).
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+ENV_AGGREGATES = ['sum', 'mean', 'min', 'max', 'std', 'count']
+CHUNK_ROWS = 1_000_000
+
+# Columns each table contributes (the rest of the file is never parsed)
+TABLES = {
+    'sectors': ('revenue_distribution_by_sector.csv',
+                ['entity_id', 'nace_level_1_code', 'nace_level_2_code', 'revenue_pct']),
+    'env': ('environmental_activities.csv', ['entity_id', 'env_score_adjustment']),
+    'sdg': ('sustainable_development_goals.csv', ['entity_id', 'sdg_id']),
+}
+
+
+def _positions(index, values):
+    """
+    (index extended with the values it does not contain yet, position of
+    every value in it). Missing values get position -1. Only the distinct
+    values of the chunk are looked up.
+    """
+    codes, uniques = pd.factorize(values)
+    positions = index.get_indexer(uniques)
+    new = positions < 0
+    if new.any():
+        positions[new] = np.arange(len(index), len(index) + new.sum())
+        index = index.append(pd.Index(uniques[new])) if len(index) else pd.Index(uniques[new])
+    return index, np.append(positions, -1)[codes]
+
+
+def _rank_slices(positions):
+    """
+    Row order and slices such that rows[order[start:stop]] is the k-th
+    occurrence of each position in the chunk, for k = 0, 1, ... (in row
+    order); within a slice every position appears at most once.
+    """
+    n = len(positions)
+    if not n:
+        return np.zeros(0, dtype=np.int64), []
+    # Stable sort by position (the row number breaks ties; faster than kind='stable')
+    by_position = np.argsort(positions.astype(np.int64) * n + np.arange(n))
+    first = np.ones(n, dtype=bool)
+    first[1:] = positions[by_position[1:]] != positions[by_position[:-1]]
+    group_start = np.maximum.accumulate(np.where(first, np.arange(n), 0))
+    rank = np.empty(n, dtype=np.int64)
+    rank[by_position] = np.arange(n) - group_start
+    order = np.argsort(rank.astype(np.min_scalar_type(rank.max())), kind='stable')  # radix sort for small ranks
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(rank))])
+    return order, list(zip(bounds[:-1], bounds[1:]))
+
+
+class KeySums:
+    """Running sum of a value (or row count) per (entity, key) pair"""
+
+    def __init__(self):
+        self.entities = pd.Index([])  # entity_ids seen, in order of appearance
+        self.keys = pd.Index([])      # non-null keys seen in any row (vocabulary())
+        self.pairs = pd.Index([], dtype='int64')  # entity position << 32 | key position
+        self.sums = np.zeros(0)
+
+    def update(self, entity_ids, keys, values=None):
+        """Fold a chunk of rows into the sums; rows with a missing id, key or value are skipped"""
+        entity_ids = pd.Series(entity_ids).to_numpy()
+        values = np.ones(len(entity_ids)) if values is None else np.asarray(values, dtype=float)
+        self.keys, key_positions = _positions(self.keys, pd.Series(keys).to_numpy())
+
+        keep = (key_positions >= 0) & ~pd.isna(entity_ids) & ~np.isnan(values)
+        self.entities, entity_positions = _positions(self.entities, entity_ids[keep])
+        codes = (entity_positions.astype(np.int64) << 32) | key_positions[keep]
+        self.pairs, positions = _positions(self.pairs, codes)
+        self.sums = np.concatenate([self.sums, np.zeros(len(self.pairs) - len(self.sums))])
+
+        # Duplicate pairs are added in row order, like a row-by-row loop
+        values = values[keep]
+        order, slices = _rank_slices(positions)
+        for start, stop in slices:
+            rows = order[start:stop]
+            self.sums[positions[rows]] += values[rows]
+        return self
+
+    def vocabulary(self):
+        """Sorted keys seen so far"""
+        return sorted(self.keys)
+
+    def matrix(self, ids, vocabulary):
+        """
+        CSR matrix with one row per ids entry and one column per vocabulary
+        entry. Entities that were never seen get an empty row, keys outside
+        the vocabulary are dropped.
+        """
+        columns = pd.Index(vocabulary).get_indexer(self.keys)[self.pairs.to_numpy() & 0xFFFFFFFF]
+        rows = self.pairs.to_numpy() >> 32
+        keep = columns >= 0
+        n_entities = len(self.entities)
+        # One extra empty row stands in for unseen entities
+        matrix = sp.csr_matrix((self.sums[keep], (rows[keep], columns[keep])),
+                               shape=(n_entities + 1, len(vocabulary)))
+        positions = self.entities.get_indexer(pd.Series(ids).to_numpy())
+        return matrix[np.where(positions >= 0, positions, n_entities)]
+
+
+class ValueStats:
+    """Running count / sum / mean / min / max / std of a value per entity"""
+
+    def __init__(self):
+        self.entities = pd.Index([])
+        self.count = np.zeros(0)
+        self.sum = np.zeros(0)
+        self.compensation = np.zeros(0)  # Kahan compensation of sum
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.mean = np.zeros(0)          # Welford running mean / M2 (for std)
+        self.m2 = np.zeros(0)
+
+    def update(self, entity_ids, values):
+        """Fold a chunk of rows into the statistics; missing values only register the entity"""
+        values = np.asarray(values, dtype=float)
+        self.entities, positions = _positions(self.entities, pd.Series(entity_ids).to_numpy())
+        new = len(self.entities) - len(self.count)
+        for name, initial in (('count', 0.0), ('sum', 0.0), ('compensation', 0.0), ('min', np.inf),
+                              ('max', -np.inf), ('mean', 0.0), ('m2', 0.0)):
+            setattr(self, name, np.concatenate([getattr(self, name), np.full(new, initial)]))
+
+        keep = (positions >= 0) & ~np.isnan(values)
+        positions, values = positions[keep], values[keep]
+        order, slices = _rank_slices(positions)
+        for start, stop in slices:
+            rows = order[start:stop]
+            self._fold(positions[rows], values[rows])
+        return self
+
+    def _fold(self, p, v):
+        """One row per position p (distinct positions)"""
+        with np.errstate(invalid='ignore'):  # inf values, as in pandas
+            self.count[p] += 1
+            # Kahan summation, as pandas' group_sum / group_mean
+            y = v - self.compensation[p]
+            t = self.sum[p] + y
+            compensation = t - self.sum[p] - y
+            self.compensation[p] = np.where(np.isnan(compensation), 0.0, compensation)
+            self.sum[p] = t
+            self.min[p] = np.where(v < self.min[p], v, self.min[p])
+            self.max[p] = np.where(v > self.max[p], v, self.max[p])
+            # Welford update, as pandas' group_var
+            old_mean = self.mean[p]
+            self.mean[p] = old_mean + (v - old_mean) / self.count[p]
+            self.m2[p] = self.m2[p] + (v - self.mean[p]) * (v - old_mean)
+
+    def frame(self):
+        """groupby('entity_id').agg(ENV_AGGREGATES) of every row folded so far"""
+        seen = self.count > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats = {
+                'sum': self.sum,
+                'mean': np.where(seen, self.sum / self.count, np.nan),
+                'min': np.where(seen, self.min, np.nan),
+                'max': np.where(seen, self.max, np.nan),
+                'std': np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan),
+                'count': self.count.astype(np.int64),
+            }
+        frame = pd.DataFrame({agg: stats[agg] for agg in ENV_AGGREGATES},
+                             index=self.entities.rename('entity_id'))
+        return frame.sort_index()
+
+
+class EntityAggregates:
+    """
+    Everything FeaturePipeline needs from the auxiliary tables. Stands in for
+    the 'sectors' / 'env' / 'sdg' frames as frames['aggregates'].
+    """
+
+    def __init__(self, nace_level_2=False):
+        self.sectors = KeySums()                          # revenue_pct by NACE level-1 code
+        self.sectors2 = KeySums() if nace_level_2 else None  # revenue_pct by NACE level-2 code
+        self.env = ValueStats()                           # env_score_adjustment
+        self.sdg = KeySums()                              # rows by sdg_id
+
+    def update(self, table, chunk):
+        """Fold a chunk of rows of one table ('sectors', 'env' or 'sdg')"""
+        if table == 'sectors':
+            self.sectors.update(chunk['entity_id'], chunk['nace_level_1_code'], chunk['revenue_pct'])
+            if self.sectors2 is not None and 'nace_level_2_code' in chunk:
+                self.sectors2.update(chunk['entity_id'], pd.to_numeric(chunk['nace_level_2_code']),
+                                     chunk['revenue_pct'])
+        elif table == 'env':
+            self.env.update(chunk['entity_id'], chunk['env_score_adjustment'])
+        elif table == 'sdg':
+            self.sdg.update(chunk['entity_id'], chunk['sdg_id'])
+        else:
+            raise ValueError(f'Unknown table: {table}')
+        return self
+
+    @classmethod
+    def from_frames(cls, frames, nace_level_2=False, entity_ids=None):
+        """
+        Aggregates of in-memory frames (each table as a single chunk),
+        optionally of the rows of entity_ids only
+        """
+        aggregates = cls(nace_level_2)
+        for table in TABLES:
+            frame = frames[table]
+            if entity_ids is not None:
+                frame = frame[frame['entity_id'].isin(entity_ids)]
+            aggregates.update(table, frame)
+        return aggregates
+
+
+def read_aggregates(data_dir='../data', chunk_rows=CHUNK_ROWS, nace_level_2=False):
+    """EntityAggregates of the auxiliary CSVs, read chunk_rows rows at a time"""
+    aggregates = EntityAggregates(nace_level_2)
+    for table, (file_name, columns) in TABLES.items():
+        path = f'{data_dir}/{file_name}'
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [col for col in columns if col in header]
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunk_rows):
+            aggregates.update(table, chunk)
+    return aggregates
@@ -0,0 +1,407 @@
+"""
+Fit/transform feature pipeline used by 01_feature_engineering.py and by the
+backend's online scoring.
+
+The pipeline works on a dict of frames shaped like the raw data files:
+    {
+        'companies': train.csv / test.csv rows,
+        'sectors':   revenue_distribution_by_sector.csv rows,
+        'env':       environmental_activities.csv rows,
+        'sdg':       sustainable_development_goals.csv rows,
+    }
+
+or, for tables too large to hold in memory, {'companies': ..., 'aggregates':
+EntityAggregates} where the sectors / env / sdg tables have been streamed
+into per-entity aggregates (load_streamed_frames()). The auxiliary tables
+are only ever used through these aggregates, so both forms give identical
+features.
+
+fit() learns everything that depends on the training data (sector / SDG /
+region vocabularies, target means, country encodings). transform() then
+builds every feature for a frame in one pass, so the same fitted pipeline
+can score a whole test set or a single new company. The fitted state is
+plain JSON (save() / load()).
+
+Only a few columns depend on the training targets (target_feature_names(): sector
+target means, country encodings and their revenue interactions). For
+leakage-free cross-validation, fit_fold() refits just those statistics on a
+fold's training rows and fold_features() swaps the affected columns into an
+already built feature matrix, so the target-independent blocks (sector
+pivot, environmental aggregates, SDG dummies, ...) are computed once and
+shared by every fold.
+
+Sparse assembly (sparse=True): the sector revenue shares and SDG counts are
+built directly as CSR matrices from the long frames (no dense pivot), and
+sparse_features() returns them hstacked with the dense columns, ready for
+XGBoost / LightGBM / CatBoost. nace_level_2=True adds the NACE level-2
+revenue shares, which are only ever materialized sparse.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from entity_aggregates import CHUNK_ROWS, ENV_AGGREGATES, EntityAggregates, read_aggregates
+from target_encoding import TargetEncoder
+
+HIGH_EMISSION_SECTORS = ['B', 'C', 'D', 'E', 'F', 'H']
+SCORE_COLUMNS = ['overall_score', 'environmental_score', 'social_score', 'governance_score']
+TARGETS = {'s1': 'target_scope_1', 's2': 'target_scope_2'}
+
+
+def load_raw_frames(data_dir='../data', read=pd.read_csv):
+    """Read the raw CSVs; returns (train_frames, test_frames)"""
+    sectors = read(f'{data_dir}/revenue_distribution_by_sector.csv')
+    env = read(f'{data_dir}/environmental_activities.csv')
+    sdg = read(f'{data_dir}/sustainable_development_goals.csv')
+    train = {'companies': read(f'{data_dir}/train.csv'), 'sectors': sectors, 'env': env, 'sdg': sdg}
+    test = {'companies': read(f'{data_dir}/test.csv'), 'sectors': sectors, 'env': env, 'sdg': sdg}
+    return train, test
+
+
+def load_streamed_frames(data_dir='../data', chunk_rows=CHUNK_ROWS, nace_level_2=False, read=pd.read_csv):
+    """
+    Like load_raw_frames, but the auxiliary CSVs are read chunk_rows rows at
+    a time into shared per-entity aggregates (frames['aggregates'])
+    """
+    aggregates = read_aggregates(data_dir, chunk_rows, nace_level_2)
+    train = {'companies': read(f'{data_dir}/train.csv'), 'aggregates': aggregates}
+    test = {'companies': read(f'{data_dir}/test.csv'), 'aggregates': aggregates}
+    return train, test
+
+
+def target_feature_names(high_emission_sectors):
+    """Feature columns computed from the training targets"""
+    return [f'sector_{sector}_{key}_mean' for sector in high_emission_sectors for key in TARGETS] + \
+        [f'country_{key}_encoded' for key in TARGETS] + [f'revenue_x_country_{key}' for key in TARGETS]
+
+
+class FeaturePipeline:
+    def __init__(self, smoothing=10, high_emission_sectors=None, sparse=False, nace_level_2=False):
+        if nace_level_2 and not sparse:
+            raise ValueError('NACE level-2 sector shares are only available with sparse=True')
+        self.smoothing = smoothing  # Higher = more regularization
+        self.high_emission_sectors = list(high_emission_sectors or HIGH_EMISSION_SECTORS)
+        self.sparse = sparse
+        self.nace_level_2 = nace_level_2
+        self.state = None
+        self._country_encoder = None
+
+    # ------------------------------------------------------------------
+    # Fitting
+    # ------------------------------------------------------------------
+    def fit(self, frames):
+        companies = frames['companies']
+
+        sector_codes, sdg_ids, sector2_codes = self._vocabularies(frames, self.nace_level_2)
+        self.state = {
+            'smoothing': self.smoothing,
+            'high_emission_sectors': [s for s in self.high_emission_sectors if s in sector_codes],
+            'sector_codes': [str(code) for code in sector_codes],
+            'sdg_ids': [int(i) for i in sdg_ids],
+            'region_codes': [str(code) for code in sorted(companies['region_code'].dropna().unique())],
+            'sparse': self.sparse,
+            'nace_level_2': self.nace_level_2,
+        }
+        if self.nace_level_2:
+            self.state['sector2_codes'] = [int(code) for code in sector2_codes]
+        self._fit_targets(companies)
+        # Column layout only: transform no rows instead of the whole training set
+        self.state['features'] = list(self.transform({**frames, 'companies': companies.iloc[:0]}).columns)
+        return self
+
+    def _fit_targets(self, companies):
+        # Country target encoding with smoothing (Bayesian mean), both scopes in one pass
+        country_encoder = TargetEncoder(self.smoothing).fit(
+            companies['country_code'], {key: companies[col] for key, col in TARGETS.items()})
+        self.state['target_means'] = country_encoder.prior
+        self.state['country_encoding'] = country_encoder.to_dict()['encoding']
+        self._country_encoder = country_encoder
+
+    def fit_fold(self, frames, train_idx):
+        """
+        Copy of this fitted pipeline whose target statistics are refit on the
+        rows train_idx of frames['companies'] (vocabularies are kept).
+        """
+        fold = FeaturePipeline.from_dict(self.state)
+        fold._fit_targets(frames['companies'].iloc[train_idx])
+        return fold
+
+    # ------------------------------------------------------------------
+    # Feature blocks
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _sectors2(aggregates):
+        if aggregates.sectors2 is None:
+            raise ValueError('NACE level-2 sector shares were not aggregated (nace_level_2=False)')
+        return aggregates.sectors2
+
+    @classmethod
+    def _vocabularies(cls, frames, nace_level_2):
+        """Sorted (NACE level-1 codes, SDG ids, NACE level-2 codes or None) of the auxiliary tables"""
+        if 'aggregates' in frames:
+            aggregates = frames['aggregates']
+            sector2_codes = cls._sectors2(aggregates).vocabulary() if nace_level_2 else None
+            return aggregates.sectors.vocabulary(), aggregates.sdg.vocabulary(), sector2_codes
+        sectors = frames['sectors']
+        sector2_codes = sorted(sectors['nace_level_2_code'].dropna().unique()) if nace_level_2 else None
+        return (sorted(sectors['nace_level_1_code'].dropna().unique()),
+                sorted(frames['sdg']['sdg_id'].dropna().unique()), sector2_codes)
+
+    @staticmethod
+    def _aggregates(frames, ids, nace_level_2):
+        """Per-entity aggregates for ids: the streamed ones, or those of the long frames' rows for ids"""
+        if 'aggregates' in frames:
+            return frames['aggregates']
+        return EntityAggregates.from_frames(frames, nace_level_2, entity_ids=ids)
+
+    def _sector_block(self, aggregates, ids):
+        """(NACE level-1 revenue share matrix, derived sector columns), rows aligned with ids"""
+        state = self.state
+        # Duplicate (entity, code) rows are summed, like pivot_table(aggfunc='sum')
+        matrix = aggregates.sectors.matrix(ids, state['sector_codes'])
+        high = [state['sector_codes'].index(s) for s in state['high_emission_sectors']]
+        entropy = matrix.copy()
+        entropy.data = entropy.data * np.log(entropy.data + 1e-10)
+
+        block = {}
+        block['high_emission_pct'] = np.asarray(matrix[:, high].sum(axis=1)).ravel()
+        block['is_high_emission'] = (block['high_emission_pct'] > 0.6).astype(int)
+        block['sector_count'] = np.diff((matrix > 0.01).indptr).astype(int)
+        block['dominant_sector'] = matrix.max(axis=1).toarray().ravel()
+        block['sector_entropy'] = -np.asarray(entropy.sum(axis=1)).ravel()
+        return matrix, block
+
+    def _sector2_matrix(self, aggregates, ids):
+        """NACE level-2 revenue share matrix (sparse pipelines with nace_level_2 only)"""
+        return self._sectors2(aggregates).matrix(ids, self.state['sector2_codes'])
+
+    def _env_block(self, aggregates):
+        block = aggregates.env.frame()  # groupby('entity_id').agg(ENV_AGGREGATES)
+        block.columns = [f'env_{agg}' for agg in ENV_AGGREGATES]
+        block['has_env'] = 1
+        block['env_std'] = block['env_std'].fillna(0)
+        return block
+
+    def _sdg_block(self, aggregates, ids):
+        """(SDG count matrix, derived SDG columns), rows aligned with ids"""
+        matrix = aggregates.sdg.matrix(ids, self.state['sdg_ids'])
+        total = np.asarray(matrix.sum(axis=1)).ravel().astype(int)
+        return matrix, {'sdg_total': total, 'has_sdg': (total > 0).astype(int)}
+
+    # ------------------------------------------------------------------
+    # Transform
+    # ------------------------------------------------------------------
+    def transform(self, frames):
+        """Feature frame (plus id/name/target passthrough columns) for frames['companies']"""
+        columns, _ = self._build(frames, dense_blocks=True)
+        return pd.DataFrame(columns)
+
+    def _build(self, frames, dense_blocks):
+        """
+        ({column: values}, [(names, CSR block)]). With dense_blocks the sector
+        and SDG blocks are expanded into columns; otherwise they are returned
+        as matrices (plus the NACE level-2 block when fitted).
+        """
+        if self.state is None:
+            raise RuntimeError('FeaturePipeline must be fitted (or loaded) before transform')
+        state = self.state
+        companies = frames['companies'].reset_index(drop=True)
+        ids = companies['entity_id']
+        revenue = companies['revenue']
+
+        columns = {col: companies[col] for col in companies.columns if col != 'region_code'}
+
+        # Log / power transformations
+        columns['log_revenue'] = np.log1p(revenue)
+        for col in SCORE_COLUMNS:
+            columns[f'log_{col}'] = np.log1p(companies[col])
+        columns['revenue_squared'] = revenue ** 2
+        columns['revenue_cubed'] = revenue ** 3
+        columns['revenue_sqrt'] = np.sqrt(revenue)
+
+        # Per-entity blocks, aligned to the companies' rows (no rows -> 0)
+        aggregates = self._aggregates(frames, ids, state.get('nace_level_2'))
+        sector_matrix, sector_columns = self._sector_block(aggregates, ids)
+        sdg_matrix, sdg_columns = self._sdg_block(aggregates, ids)
+        sparse_blocks = [(self.sector_columns, sector_matrix)]
+        if state.get('nace_level_2'):
+            sparse_blocks.append(([f'sector2_{code}' for code in state['sector2_codes']],
+                                  self._sector2_matrix(aggregates, ids)))
+        sparse_blocks.append((self.sdg_columns, sdg_matrix))
+
+        if dense_blocks:
+            columns.update(zip(self.sector_columns, sector_matrix.toarray().T))
+        columns.update(sector_columns)
+        # Placeholders keep the sector target means next to the sector block
+        columns.update(dict.fromkeys(f'sector_{s}_{key}_mean' for s in state['high_emission_sectors'] for key in TARGETS))
+
+        env = self._env_block(aggregates)
+        aligned = env.reindex(ids).astype(float).fillna(0)  # float whichever companies have rows
+        for col in env.columns:
+            columns[col] = aligned[col].to_numpy()
+
+        if dense_blocks:
+            columns.update(zip(self.sdg_columns, sdg_matrix.toarray().astype(int).T))
+        columns.update(sdg_columns)
+
+        # One-hot regions over the fitted vocabulary
+        for code in state['region_codes']:
+            columns[f'region_{code}'] = (companies['region_code'] == code).to_numpy()
+
+        columns.update(dict.fromkeys(f'country_{key}_encoded' for key in TARGETS))
+
+        # Interactions
+        columns['revenue_x_high_emission'] = revenue * columns['high_emission_pct']
+        columns['log_revenue_x_env'] = columns['log_revenue'] * companies['environmental_score']
+        columns.update(dict.fromkeys(f'revenue_x_country_{key}' for key in TARGETS))
+        columns['env_to_overall'] = companies['environmental_score'] / (companies['overall_score'] + 1e-6)
+        columns['social_to_overall'] = companies['social_score'] / (companies['overall_score'] + 1e-6)
+        columns['env_x_high_emission'] = columns['env_sum'] * columns['high_emission_pct']
+
+        high_shares = {f'sector_{s}': sector_matrix[:, state['sector_codes'].index(s)].toarray().ravel()
+                       for s in state['high_emission_sectors']}
+        columns.update(self._target_columns(companies, high_shares))
+        return columns, sparse_blocks
+
+    def _target_columns(self, companies, shares):
+        """
+        Columns computed from the fitted target statistics (target_feature_names());
+        shares maps sector_<code> to the revenue shares of the high-emission sectors.
+        """
+        state = self.state
+        revenue = companies['revenue'].to_numpy()
+        target = {}
+
+        # Sector target encoding: training mean emissions where the company has revenue in the sector
+        for sector in state['high_emission_sectors']:
+            active = (np.asarray(shares[f'sector_{sector}']) > 0).astype(float)
+            for key in TARGETS:
+                target[f'sector_{sector}_{key}_mean'] = active * state['target_means'][key]
+
+        # Country target encoding (unseen countries fall back to the training mean)
+        country = self.country_encoder.transform(companies['country_code'])
+        for key in TARGETS:
+            target[f'country_{key}_encoded'] = country[key].to_numpy()
+            target[f'revenue_x_country_{key}'] = revenue * target[f'country_{key}_encoded']
+        return target
+
+    def features(self, frames):
+        """Model input matrix: transform() restricted to the fitted feature list"""
+        return self.transform(frames)[self.feature_names]
+
+    def refresh_targets(self, rows):
+        """
+        transform() rows (e.g. stored ones) with the target-dependent columns
+        recomputed from this pipeline's target statistics
+        """
+        rows = rows.reset_index(drop=True)
+        return rows.assign(**self._target_columns(rows, rows))
+
+    def sparse_features(self, frames):
+        """
+        Model input as a CSR matrix whose columns follow sparse_feature_names:
+        the dense features, then the sector (and NACE level-2) and SDG blocks,
+        which are never densified.
+        """
+        columns, blocks = self._build(frames, dense_blocks=False)
+        block_names = {col for names, _ in blocks for col in names}
+        dense = np.column_stack([np.asarray(columns[col], dtype=float)
+                                 for col in self.sparse_feature_names if col not in block_names])
+        return sp.hstack([sp.csr_matrix(dense)] + [matrix for _, matrix in blocks], format='csr')
+
+    def model_input(self, frames):
+        """What the models are trained on: sparse_features() for a sparse pipeline, else features()"""
+        return self.sparse_features(frames) if self.is_sparse else self.features(frames)
+
+    def fold_features(self, frames, X, folds):
+        """
+        {fold: X with its target-dependent columns recomputed by a pipeline
+        refit on that fold's training rows}. X is model_input() of frames (a
+        frame or a sparse matrix); every other column is reused as is.
+        """
+        companies = frames['companies'].reset_index(drop=True)
+        sparse = sp.issparse(X)
+        columns = self.sparse_feature_names if sparse else list(X.columns)
+        names = [col for col in target_feature_names(self.state['high_emission_sectors']) if col in columns]
+        shares = X
+        if sparse:
+            position = {col: i for i, col in enumerate(columns)}
+            shares = {f'sector_{s}': X[:, position[f'sector_{s}']].toarray().ravel()
+                      for s in self.state['high_emission_sectors']}
+            keep = [i for i, col in enumerate(columns) if col not in set(names)]
+            order = np.argsort(keep + [position[col] for col in names])
+            base = X[:, keep]
+
+        fold_frames = {}
+        for fold, (train_idx, _) in enumerate(folds):
+            target = self.fit_fold(frames, train_idx)._target_columns(companies, shares)
+            if sparse:
+                values = sp.csr_matrix(np.column_stack([target[col] for col in names]))
+                fold_frames[fold] = sp.hstack([base, values], format='csr')[:, order]
+            else:
+                fold_frames[fold] = X.assign(**{col: target[col] for col in names})
+        return fold_frames
+
+    @property
+    def country_encoder(self):
+        if self._country_encoder is None:
+            self._country_encoder = TargetEncoder.from_dict({
+                'smoothing': self.state['smoothing'],
+                'prior': self.state['target_means'],
+                'encoding': self.state['country_encoding'],
+            })
+        return self._country_encoder
+
+    @property
+    def feature_names(self):
+        exclude = {'entity_id', 'region_name', 'country_name', 'country_code', *TARGETS.values()}
+        return [c for c in self.state['features'] if c not in exclude]
+
+    @property
+    def is_sparse(self):
+        return bool(self.state.get('sparse'))
+
+    @property
+    def sector_columns(self):
+        return [f'sector_{code}' for code in self.state['sector_codes']]
+
+    @property
+    def sdg_columns(self):
+        return [f'sdg_{i}' for i in self.state['sdg_ids']]
+
+    @property
+    def sparse_feature_names(self):
+        """Column names of sparse_features(): dense features first, then the sparse blocks"""
+        sector2 = [f'sector2_{code}' for code in self.state.get('sector2_codes', [])]
+        blocks = self.sector_columns + sector2 + self.sdg_columns
+        return [c for c in self.feature_names if c not in set(blocks)] + blocks
+
+    @property
+    def input_names(self):
+        """Column names of model_input()"""
+        return self.sparse_feature_names if self.is_sparse else self.feature_names
+
+    # ------------------------------------------------------------------
+    # Serialization
+    # ------------------------------------------------------------------
+    def to_dict(self):
+        return dict(self.state)
+
+    @classmethod
+    def from_dict(cls, state):
+        pipeline = cls(smoothing=state['smoothing'], high_emission_sectors=state['high_emission_sectors'],
+                       sparse=state.get('sparse', False), nace_level_2=state.get('nace_level_2', False))
+        pipeline.state = dict(state)
+        return pipeline
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,127 @@
+"""
+Incremental feature store for 01_feature_engineering.py (FEATURE_STORE=<dir>).
+
+A store keeps one row per entity_id: the FeaturePipeline.transform() output
+plus a hash of the source rows behind it (the company's row and its sector,
+environmental and SDG rows). It is written as a typed Arrow table
+(<dir>/<name>.arrow) next to a small JSON file with the fitted pipeline's
+state hashes (<dir>/<name>.json).
+
+On update() only what changed is recomputed:
+- entities whose source hash is new or different are transformed again,
+  entities that disappeared are dropped, everything else is reused;
+- if the pipeline's target statistics changed (target means, country
+  encodings), the target-dependent columns of the reused rows are refreshed
+  from the stored rows (no source data needed);
+- if the column layout changed (sector / SDG / region vocabularies, feature
+  list), every entity is rebuilt.
+
+Row hashes are summed per entity, so the order of rows in the CSVs does not
+matter but every added, removed or edited row does.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from data_io import load_frame, save_frame
+
+HASH_COLUMN = '_source_hash'
+TARGET_STATE = ('target_means', 'country_encoding')
+SOURCES = ('sectors', 'env', 'sdg')
+
+
+def _state_hash(state):
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def entity_hashes(frames):
+    """uint64 source hash per company row (frames['companies'] order)"""
+    companies = frames['companies'].reset_index(drop=True)
+    ids = companies['entity_id'].to_numpy()
+    parts = {'companies': pd.util.hash_pandas_object(companies, index=False).to_numpy()}
+    for name in SOURCES:
+        frame = frames[name]
+        rows = pd.Series(pd.util.hash_pandas_object(frame, index=False).to_numpy(), index=frame['entity_id'].to_numpy())
+        per_entity = rows.groupby(level=0).sum()  # order-independent, wraps modulo 2**64
+        position = per_entity.index.get_indexer(ids)
+        parts[name] = np.where(position >= 0, per_entity.to_numpy()[position], np.uint64(0))
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+
+def subset_frames(frames, entity_ids):
+    """frames restricted to the given entities"""
+    return {name: frame[frame['entity_id'].isin(entity_ids)] for name, frame in frames.items()}
+
+
+class FeatureStore:
+    def __init__(self, directory, name):
+        self.directory = Path(directory)
+        self.name = name
+        self.table_path = self.directory / name
+        self.meta_path = self.directory / f'{name}.json'
+
+    def _load(self):
+        if not self.meta_path.exists() or not self.table_path.with_suffix('.arrow').exists():
+            return None, {}
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        return load_frame(self.table_path), meta
+
+    def _save(self, rows, meta):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        save_frame(rows, self.table_path)
+        tmp_path = self.meta_path.with_name(self.meta_path.name + f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, self.meta_path)
+
+    def update(self, pipeline, frames):
+        """
+        Bring the store up to date with frames and a fitted pipeline.
+        Returns (transform() frame in frames['companies'] order, update stats).
+        """
+        companies = frames['companies'].reset_index(drop=True)
+        ids = companies['entity_id']
+        if not ids.is_unique:
+            raise ValueError('FeatureStore needs unique entity_ids')
+        hashes = entity_hashes(frames)
+        layout_hash = _state_hash({k: v for k, v in pipeline.state.items() if k not in TARGET_STATE})
+        target_hash = _state_hash({k: pipeline.state[k] for k in TARGET_STATE})
+
+        stored, meta = self._load()
+        removed = 0 if stored is None else int((~stored['entity_id'].isin(ids)).sum())
+        rebuilt = stored is None or meta.get('layout_hash') != layout_hash
+        if rebuilt:
+            kept = None
+            stale = np.ones(len(ids), dtype=bool)
+        else:
+            position = pd.Index(stored['entity_id']).get_indexer(ids)
+            stored_hashes = stored[HASH_COLUMN].to_numpy(dtype=np.uint64)
+            stale = (position < 0) | (stored_hashes[np.maximum(position, 0)] != hashes)
+            kept = stored.iloc[position[~stale]].drop(columns=HASH_COLUMN)
+
+        targets_refreshed = not rebuilt and meta.get('target_hash') != target_hash and len(kept) > 0
+        if targets_refreshed:
+            kept = pipeline.refresh_targets(kept)
+
+        parts = [] if kept is None else [kept]
+        if stale.any():
+            parts.append(pipeline.transform(subset_frames(frames, ids[stale])))
+        rows = pd.concat(parts, ignore_index=True) if parts else pipeline.transform(frames)
+        rows = rows.set_index('entity_id', drop=False).loc[ids].reset_index(drop=True)
+
+        self._save(rows.assign(**{HASH_COLUMN: hashes}),
+                   {'layout_hash': layout_hash, 'target_hash': target_hash, 'entities': len(rows)})
+        stats = {
+            'entities': len(rows),
+            'recomputed': int(stale.sum()),
+            'removed': removed,
+            'rebuilt': rebuilt,
+            'targets_refreshed': targets_refreshed,
+        }
+        return rows, stats
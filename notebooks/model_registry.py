@@ -0,0 +1,146 @@
+"""
+Versioned storage for trained ensembles.
+
+Each call to ModelRegistry.publish() writes a new immutable version:
+
+    models/
+        LATEST                          # name of the newest version
+        20250101-120000-3f2a9c1e/
+            manifest.json               # features, params, data hash, CV scores
+            feature_pipeline.json
+            xgb_s1.json  lgb_s1.txt  cat_s1.cbm
+            xgb_s2.json  lgb_s2.txt  cat_s2.cbm
+
+Models are stored in each library's native format (see ensemble.py), so
+loading a version only deserializes boosters and never retrains.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from ensemble import ENSEMBLE_WEIGHTS, PIPELINE_FILE, load_ensemble, model_files, save_ensemble
+from feature_pipeline import FeaturePipeline
+
+MANIFEST_FILE = 'manifest.json'
+LATEST_FILE = 'LATEST'
+
+
+def data_hash(*frames):
+    """Stable content hash of the training data (values, columns and dtypes)"""
+    digest = hashlib.sha256()
+    for frame in frames:
+        if sp.issparse(frame):
+            matrix = sp.csr_matrix(frame, copy=True)
+            matrix.sort_indices()
+            digest.update(json.dumps(['csr', list(matrix.shape), str(matrix.dtype)]).encode())
+            for part in (matrix.indptr.astype(np.int64), matrix.indices.astype(np.int64), matrix.data):
+                digest.update(np.ascontiguousarray(part).tobytes())
+            continue
+        frame = pd.DataFrame(frame)
+        digest.update(json.dumps([[str(c), str(t)] for c, t in frame.dtypes.items()]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def library_versions():
+    import catboost
+    import lightgbm
+    import xgboost
+
+    return {'xgboost': xgboost.__version__, 'lightgbm': lightgbm.__version__, 'catboost': catboost.__version__}
+
+
+class ModelArtifact:
+    """One loaded registry version"""
+
+    def __init__(self, version, manifest, models, pipeline):
+        self.version = version
+        self.manifest = manifest
+        self.models = models
+        self.pipeline = pipeline
+
+
+class ModelRegistry:
+    def __init__(self, root='models'):
+        self.root = Path(root)
+
+    def versions(self):
+        """Published versions, oldest first"""
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir()
+                      if not p.name.startswith('.') and (p / MANIFEST_FILE).exists())
+
+    def latest(self):
+        pointer = self.root / LATEST_FILE
+        if pointer.exists():
+            version = pointer.read_text().strip()
+            if (self.root / version / MANIFEST_FILE).exists():
+                return version
+        versions = self.versions()
+        if not versions:
+            raise FileNotFoundError(f'No model versions in {self.root}; run 02_model_training.py')
+        return versions[-1]
+
+    def path(self, version=None):
+        return self.root / (version or self.latest())
+
+    def manifest(self, version=None):
+        with open(self.path(version) / MANIFEST_FILE) as f:
+            return json.load(f)
+
+    def publish(self, models, pipeline_path, features, params, data_digest, cv_scores,
+                weights=ENSEMBLE_WEIGHTS, attachments=None, **extra):
+        """
+        Write models + manifest as a new version and point LATEST at it.
+        attachments maps file name -> path of an extra file copied into the version.
+        """
+        version = f"{time.strftime('%Y%m%d-%H%M%S')}-{data_digest[:8]}"
+        while (self.root / version).exists():
+            version += '_'
+
+        # Build the version under a temporary name so readers never see a partial one
+        staging = self.root / f'.{version}.tmp'
+        if staging.exists():
+            shutil.rmtree(staging)
+        save_ensemble(models, staging, pipeline_path=pipeline_path)
+        for name, source in (attachments or {}).items():
+            shutil.copyfile(source, staging / name)
+        manifest = {
+            'version': version,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'features': list(features),
+            'weights': weights,
+            'params': params,
+            'data_hash': data_digest,
+            'cv_scores': cv_scores,
+            'files': {
+                scope: {family: model_files(family, scope, model) for family, model in family_models.items()}
+                for scope, family_models in models.items()
+            },
+            'libraries': library_versions(),
+            **extra,
+        }
+        with open(staging / MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(staging, self.root / version)
+
+        pointer_tmp = self.root / f'.{LATEST_FILE}.tmp'
+        pointer_tmp.write_text(version + '\n')
+        os.replace(pointer_tmp, self.root / LATEST_FILE)
+        return version
+
+    def load(self, version=None):
+        """Restore a full ensemble (latest version by default)"""
+        path = self.path(version)
+        manifest = self.manifest(path.name)
+        pipeline = FeaturePipeline.load(path / PIPELINE_FILE)
+        return ModelArtifact(path.name, manifest, load_ensemble(path), pipeline)
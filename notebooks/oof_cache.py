@@ -0,0 +1,68 @@
+"""
+Out-of-fold (OOF) prediction cache shared by 02_model_training.py and
+03_test_model.py.
+
+02 already predicts every validation fold during its CV. It stores those
+predictions (log space, one array per scope x model, each training row
+predicted by the model of the fold that held it out) together with the
+fold assignment in a compressed .npz file. 03 computes its metrics from
+that file instead of retraining the ensemble.
+
+The cache is tagged with a key hashed from the training data, the model
+parameters, the fold setup and the library versions. load_oof() returns
+None when any of them changed, and the caller recomputes.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+OOF_FILE = 'oof_predictions.npz'
+
+
+def oof_key(data_digest, params, n_splits, random_state, libraries):
+    payload = {
+        'data_hash': data_digest,
+        'params': params,
+        'folds': {'n_splits': n_splits, 'random_state': random_state},
+        'libraries': libraries,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def fold_ids(folds, n_rows):
+    """Fold number of each row from a list of (train_idx, val_idx)"""
+    ids = np.full(n_rows, -1, dtype=np.int8)
+    for fold, (_, val_idx) in enumerate(folds):
+        ids[val_idx] = fold
+    return ids
+
+
+def save_oof(path, key, fold_of_row, predictions):
+    """predictions maps (scope, model) -> OOF array in log space"""
+    path = Path(path)
+    arrays = {f'pred__{scope}__{model}': np.asarray(pred, dtype=np.float64)
+              for (scope, model), pred in predictions.items()}
+    tmp_path = path.with_name(path.name + f'.{os.getpid()}.tmp.npz')
+    np.savez_compressed(tmp_path, key=np.array(key), fold=fold_of_row, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_oof(path, key):
+    """(fold_of_row, {(scope, model): OOF array}) or None if missing / stale"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        if str(data['key']) != key:
+            return None
+        predictions = {}
+        for name in data.files:
+            if name.startswith('pred__'):
+                _, scope, model = name.split('__')
+                predictions[(scope, model)] = data[name]
+        return data['fold'], predictions
@@ -0,0 +1,270 @@
+"""
+Successive-halving search over the ensemble's booster parameters and blend
+weights, used by 05_hyperparameter_search.py.
+
+- n_trials configurations are sampled from SEARCH_SPACE (seeded, so the same
+  search always proposes the same trials).
+- Rung r trains every surviving trial with min_rounds * eta**r boosting
+  rounds on the same KFold splits as 02_model_training.py; the best
+  1/eta of the trials move on to the next rung.
+- A trial's score is the combined original-space CV RMSE of its ensemble
+  with the best blend weights on a WEIGHT_STEP grid (computed from the
+  out-of-fold predictions, so weights cost no extra fits).
+- All fold x model x target x trial jobs of a batch run together on
+  CVExecutor's process pool. With fold_frames (FeaturePipeline.fold_features)
+  each fold trains on its own fold-refit target encodings.
+- Every evaluation is appended to a JSON-lines file. Rerunning the same
+  search skips evaluations already on disk, so an interrupted search
+  resumes where it stopped. Records are tagged with search_key() (training
+  data, targets, folds and base parameters); records of a different key
+  are ignored, so a search over changed data starts over.
+"""
+
+import hashlib
+import itertools
+import json
+from pathlib import Path
+
+import numpy as np
+
+from cv_executor import Job
+from ensemble import DEFAULT_PARAMS, ROUNDS_PARAM
+from model_registry import data_hash
+from oof_cache import fold_ids
+
+FAMILIES = ('xgb', 'lgb', 'cat')
+SCOPES = ('s1', 's2')
+WEIGHT_STEP = 0.05
+
+# Set on every searched configuration: LightGBM only bags rows (subsample)
+# when subsample_freq > 0
+FIXED_PARAMS = {'lgb': {'subsample_freq': 1}}
+
+# (kind, low, high): 'int' uniform integer, 'float' uniform, 'log' log-uniform
+SEARCH_SPACE = {
+    'xgb': {
+        'max_depth': ('int', 2, 8),
+        'learning_rate': ('log', 0.01, 0.2),
+        'subsample': ('float', 0.5, 1.0),
+        'colsample_bytree': ('float', 0.5, 1.0),
+        'min_child_weight': ('log', 1.0, 30.0),
+        'reg_alpha': ('log', 0.01, 10.0),
+        'reg_lambda': ('log', 0.1, 20.0),
+    },
+    'lgb': {
+        'max_depth': ('int', 2, 8),
+        'learning_rate': ('log', 0.01, 0.2),
+        'subsample': ('float', 0.5, 1.0),
+        'colsample_bytree': ('float', 0.5, 1.0),
+        'min_child_samples': ('int', 5, 50),
+        'reg_alpha': ('log', 0.01, 10.0),
+        'reg_lambda': ('log', 0.1, 20.0),
+    },
+    'cat': {
+        'depth': ('int', 3, 8),
+        'learning_rate': ('log', 0.01, 0.2),
+        'l2_leaf_reg': ('log', 0.5, 30.0),
+    },
+}
+
+
+def sample_params(rng, space=SEARCH_SPACE):
+    """One configuration: {family: {param: value}} for the searched parameters"""
+    config = {}
+    for family, params in space.items():
+        config[family] = {}
+        for name, (kind, low, high) in params.items():
+            if kind == 'int':
+                value = int(rng.integers(low, high + 1))
+            elif kind == 'log':
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = float(rng.uniform(low, high))
+            config[family][name] = value
+    return config
+
+
+def full_params(config, rounds, base=DEFAULT_PARAMS):
+    """Complete model parameters: base params + fixed params + searched values + boosting rounds"""
+    return {
+        family: {**base[family], **FIXED_PARAMS.get(family, {}), **config.get(family, {}),
+                 ROUNDS_PARAM[family]: rounds}
+        for family in FAMILIES
+    }
+
+
+def search_key(X, targets, folds, fold_features=False, base=DEFAULT_PARAMS):
+    """Hash of everything a trial's score depends on besides its configuration"""
+    fold_of_row = fold_ids(folds, X.shape[0])
+    payload = {
+        'data_hash': data_hash(X, *(np.asarray(targets[scope]) for scope in SCOPES)),
+        'folds': hashlib.sha256(fold_of_row.tobytes()).hexdigest(),
+        'fold_features': fold_features,
+        'base_params': base,
+        'fixed_params': FIXED_PARAMS,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def weight_grid(step=WEIGHT_STEP):
+    """All (xgb, lgb, cat) weights on a simplex grid"""
+    n = int(round(1 / step))
+    return np.array([(a, b, n - a - b) for a, b in itertools.product(range(n + 1), repeat=2) if a + b <= n]) / n
+
+
+def best_blend(oof_log, targets, folds, grid=None):
+    """
+    Blend weights minimising the combined CV RMSE of the two scopes.
+    oof_log maps (scope, family) -> out-of-fold log predictions.
+    Returns ({family: weight}, combined RMSE, {scope: RMSE}).
+    """
+    grid = weight_grid() if grid is None else grid
+    fold_scores = {}
+    for scope in SCOPES:
+        preds = np.stack([np.expm1(oof_log[(scope, family)]) for family in FAMILIES])
+        blended = np.maximum(grid @ preds, 0)  # (n_weights, n_rows)
+        sq_err = (blended - targets[scope]) ** 2
+        # Mean over folds of per-fold RMSE, as reported by 02_model_training.py
+        fold_scores[scope] = np.mean([np.sqrt(sq_err[:, val_idx].mean(axis=1)) for _, val_idx in folds], axis=0)
+    combined = np.sqrt((fold_scores['s1'] ** 2 + fold_scores['s2'] ** 2) / 2)
+    best = int(np.argmin(combined))
+    weights = {family: round(float(w), 4) for family, w in zip(FAMILIES, grid[best])}
+    return weights, float(combined[best]), {scope: float(fold_scores[scope][best]) for scope in SCOPES}
+
+
+class SuccessiveHalving:
+    def __init__(self, executor, X, targets, folds, n_trials=27, eta=3, min_rounds=100, max_rounds=900,
+                 seed=42, results_path='search/trials.jsonl', batch_size=None, fold_frames=None):
+        self.executor = executor
+        self.X = X
+        self.fold_frames = fold_frames
+        self.targets = {scope: np.asarray(y) for scope, y in targets.items()}
+        self.folds = folds
+        self.n_trials = n_trials
+        self.eta = eta
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.seed = seed
+        self.results_path = Path(results_path)
+        # Trials evaluated per executor run (and per checkpoint to disk)
+        self.batch_size = batch_size or max(2, executor.n_workers // 10)
+
+        rng = np.random.default_rng(seed)
+        self.configs = [sample_params(rng) for _ in range(n_trials)]
+        self.key = search_key(X, self.targets, folds, fold_features=fold_frames is not None)
+        self.stale_records = 0
+
+    def rungs(self):
+        """Boosting rounds per rung: min_rounds, min_rounds * eta, ... up to max_rounds"""
+        rounds = [self.min_rounds]
+        while rounds[-1] * self.eta <= self.max_rounds:
+            rounds.append(rounds[-1] * self.eta)
+        return rounds
+
+    def load_records(self):
+        """
+        Evaluations already on disk for this search: {(trial, rounds): record}.
+        Records of the same trial but another search_key() are counted in
+        stale_records and ignored.
+        """
+        records = {}
+        self.stale_records = 0
+        if self.results_path.exists():
+            with open(self.results_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partially written last line of an interrupted run
+                    trial = record.get('trial')
+                    if not (isinstance(trial, int) and trial < self.n_trials
+                            and record.get('config') == self.configs[trial]):
+                        continue
+                    if record.get('key') != self.key:
+                        self.stale_records += 1
+                        continue
+                    records[(trial, record['rounds'])] = record
+        return records
+
+    def evaluate(self, trials, rounds):
+        """CV-evaluate several trials at one rung in a single executor run"""
+        log_targets = {scope: np.log1p(y) for scope, y in self.targets.items()}
+        jobs = []
+        for trial in trials:
+            params = full_params(self.configs[trial], rounds)
+            for scope in SCOPES:
+                for family in FAMILIES:
+                    for fold, (train_idx, val_idx) in enumerate(self.folds):
+                        jobs.append(Job((trial, scope, family, fold), family, params[family], scope,
+                                        columns=None, train_idx=train_idx, val_idx=val_idx, keep_model=False,
+                                        frame=fold if self.fold_frames else None))
+        results = self.executor.run(jobs, self.X, log_targets, frames=self.fold_frames)
+
+        records = []
+        for trial in trials:
+            oof_log = {}
+            for scope in SCOPES:
+                for family in FAMILIES:
+                    pred = np.zeros(self.X.shape[0])
+                    for fold, (_, val_idx) in enumerate(self.folds):
+                        pred[val_idx] = results[(trial, scope, family, fold)].val_pred
+                    oof_log[(scope, family)] = pred
+            weights, score, scope_scores = best_blend(oof_log, self.targets, self.folds)
+            records.append({
+                'trial': trial,
+                'rounds': rounds,
+                'key': self.key,
+                'config': self.configs[trial],
+                'weights': weights,
+                'score': score,
+                'scope_scores': scope_scores,
+                'fit_seconds': round(sum(results[(trial, s, f, k)].seconds for s in SCOPES for f in FAMILIES
+                                         for k in range(len(self.folds))), 2),
+            })
+        return records
+
+    def _append(self, records):
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.results_path, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+    def run(self, log=print):
+        """Run (or resume) the search; returns the best record of the last rung"""
+        records = self.load_records()
+        if self.stale_records:
+            log(f"   Ignoring {self.stale_records} stored evaluation(s) from different data, folds or base params")
+        alive = list(range(self.n_trials))
+        rungs = self.rungs()
+        for rung, rounds in enumerate(rungs):
+            todo = [trial for trial in alive if (trial, rounds) not in records]
+            log(f"   Rung {rung + 1}/{len(rungs)}: {len(alive)} trials x {rounds} rounds "
+                f"({len(alive) - len(todo)} already done)")
+            for start in range(0, len(todo), self.batch_size):
+                batch = self.evaluate(todo[start:start + self.batch_size], rounds)
+                self._append(batch)
+                for record in batch:
+                    records[(record['trial'], rounds)] = record
+                    log(f"      trial {record['trial']:3d}: RMSE {record['score']:,.0f}")
+
+            ranked = sorted(alive, key=lambda trial: records[(trial, rounds)]['score'])
+            if rung < len(rungs) - 1:
+                alive = ranked[:max(1, len(ranked) // self.eta)]
+            best = records[(ranked[0], rounds)]
+        return best
+
+    def best_config(self, record):
+        """Configuration file consumed by 02_model_training.py (PARAMS_FILE)"""
+        return {
+            'params': full_params(record['config'], record['rounds']),
+            'weights': record['weights'],
+            'cv_rmse': record['score'],
+            'cv_rmse_by_scope': record['scope_scores'],
+            'search': {
+                'trial': record['trial'],
+                'n_trials': self.n_trials,
+                'eta': self.eta,
+                'rungs': self.rungs(),
+                'seed': self.seed,
+            },
+        }
@@ -0,0 +1,136 @@
+"""
+Smoothed target encoding of one categorical key (e.g. country_code, or a
+NACE code) for one or more targets at once, used by FeaturePipeline.
+
+    encoded(key) = (sum of targets for key + prior * smoothing) / (count for key + smoothing)
+
+The prior is the target mean, so rare keys shrink towards it and unseen keys
+get it exactly. Keys are factorized once and all per-key sums / counts come
+from np.bincount, so fitting and encoding stay vectorized for millions of
+rows and high-cardinality keys.
+
+fit_transform_oof() encodes the training rows out of fold: each row is
+encoded with the statistics (and prior) of the other folds only, so its own
+target never leaks into its feature. The per-fold statistics are the full
+statistics minus the fold's own, so all folds cost one extra pass.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _as_targets(targets):
+    """{name: float array} from a DataFrame, a dict of arrays or a Series"""
+    if isinstance(targets, pd.Series):
+        targets = {targets.name: targets}
+    return {name: np.asarray(values, dtype=float) for name, values in dict(targets).items()}
+
+
+class TargetEncoder:
+    def __init__(self, smoothing=10):
+        self.smoothing = smoothing  # Higher = more regularization
+        self.keys = None      # pd.Index of the fitted keys (as str)
+        self.prior = None     # {target: mean}
+        self.encoding = None  # {target: array aligned with self.keys}
+
+    @staticmethod
+    def _codes(keys):
+        """(codes, uniques); missing keys get code -1 and are left out of the statistics"""
+        keys = pd.Series(keys).reset_index(drop=True)
+        codes, uniques = pd.factorize(keys.where(keys.isna(), keys.astype(str)))
+        return codes, pd.Index(uniques, dtype=object)
+
+    @staticmethod
+    def _stats(codes, y, n_keys):
+        """Per-key (sum, count) of y, skipping missing keys and missing targets"""
+        valid = (codes >= 0) & ~np.isnan(y)
+        sums = np.bincount(codes[valid], weights=y[valid], minlength=n_keys)
+        counts = np.bincount(codes[valid], minlength=n_keys).astype(float)
+        return sums, counts
+
+    def _smooth(self, sums, counts, prior):
+        return (sums + prior * self.smoothing) / (counts + self.smoothing)
+
+    def fit(self, keys, targets):
+        codes, self.keys = self._codes(keys)
+        self.prior, self.encoding = {}, {}
+        for name, y in _as_targets(targets).items():
+            prior = float(np.nanmean(y))
+            sums, counts = self._stats(codes, y, len(self.keys))
+            self.prior[name] = prior
+            self.encoding[name] = self._smooth(sums, counts, prior)
+        return self
+
+    def transform(self, keys):
+        """Encoded frame (one column per target) in the order of keys"""
+        if self.encoding is None:
+            raise RuntimeError('TargetEncoder must be fitted (or loaded) before transform')
+        keys = pd.Series(keys).reset_index(drop=True)
+        positions = self.keys.get_indexer(keys.where(keys.isna(), keys.astype(str)))
+        seen = positions >= 0
+        columns = {}
+        for name, encoded in self.encoding.items():
+            values = np.full(len(keys), self.prior[name])
+            values[seen] = encoded[positions[seen]]
+            columns[name] = values
+        return pd.DataFrame(columns)
+
+    def fit_transform_oof(self, keys, targets, fold_of_row):
+        """
+        Fit on every row (for later transform() calls) and return the
+        out-of-fold encoding of the training rows. fold_of_row gives each
+        row's validation fold (oof_cache.fold_ids); rows with fold -1 are in
+        no validation fold and get the full-data encoding.
+        """
+        self.fit(keys, targets)
+        codes, _ = self._codes(keys)
+        fold_of_row = np.asarray(fold_of_row)
+        n_folds = int(fold_of_row.max()) + 1
+        n_keys = len(self.keys)
+        in_fold = fold_of_row >= 0
+        known = codes >= 0
+
+        columns = {}
+        for name, y in _as_targets(targets).items():
+            sums, counts = self._stats(codes, y, n_keys)
+            valid = ~np.isnan(y)
+            # Statistics of each (key, fold) cell, then "everything but my fold" per row
+            cell = codes * n_folds + fold_of_row
+            use = known & in_fold & valid
+            fold_sums = np.bincount(cell[use], weights=y[use], minlength=n_keys * n_folds)
+            fold_counts = np.bincount(cell[use], minlength=n_keys * n_folds).astype(float)
+            fold_total = np.bincount(fold_of_row[in_fold & valid], weights=y[in_fold & valid], minlength=n_folds)
+            fold_n = np.bincount(fold_of_row[in_fold & valid], minlength=n_folds).astype(float)
+
+            values = self.transform(keys)[name].to_numpy()
+            fold = fold_of_row[in_fold]
+            prior = (np.nansum(y) - fold_total[fold]) / (valid.sum() - fold_n[fold])
+            key_known = known[in_fold]
+            row_codes, row_cells = codes[in_fold], cell[in_fold]
+            row_sums = np.where(key_known, sums[row_codes] - fold_sums[row_cells], 0.0)
+            row_counts = np.where(key_known, counts[row_codes] - fold_counts[row_cells], 0.0)
+            values[in_fold] = self._smooth(row_sums, row_counts, prior)
+            columns[name] = values
+        return pd.DataFrame(columns)
+
+    # ------------------------------------------------------------------
+    # Serialization (plain JSON, embedded in the FeaturePipeline state)
+    # ------------------------------------------------------------------
+    def to_dict(self):
+        return {
+            'smoothing': self.smoothing,
+            'prior': dict(self.prior),
+            'encoding': {name: dict(sorted(zip(self.keys, map(float, encoded)))) for name, encoded in self.encoding.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        encoder = cls(smoothing=state['smoothing'])
+        encoder.prior = {name: float(value) for name, value in state['prior'].items()}
+        keys = sorted({key for mapping in state['encoding'].values() for key in mapping})
+        encoder.keys = pd.Index(keys, dtype=object)
+        encoder.encoding = {
+            name: np.array([mapping.get(key, encoder.prior[name]) for key in keys], dtype=float)
+            for name, mapping in state['encoding'].items()
+        }
+        return encoder